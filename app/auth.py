@@ -1,25 +1,141 @@
-
-import jwt
 import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
 
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-this")
 JWT_ALGORITHM = "HS256"
 
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class TokenCache:
+    """Bounded LRU of already verified tokens plus the set of revoked ones.
+
+    Entries are keyed by the token's SHA-256 so raw tokens are never held in
+    memory, and each entry keeps the token's exp so expiry is still honoured.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+
+    def get(self, token_hash: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(token_hash)
+        if not entry:
+            return None
+        if entry["exp"] <= time.time() or token_hash in self._revoked:
+            del self._entries[token_hash]
+            return None
+        self._entries.move_to_end(token_hash)
+        return entry
+
+    def put(self, token_hash: str, user_id: str, exp: float):
+        self._entries[token_hash] = {"user_id": user_id, "exp": exp, "user": None}
+        self._entries.move_to_end(token_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set_user(self, token_hash: str, user: Dict):
+        entry = self._entries.get(token_hash)
+        if entry:
+            # Only the profile fields routes read; the password hash never sits in the cache
+            entry["user"] = {key: value for key, value in user.items() if key != "password_hash"}
+
+    def revoke(self, token_hash: str, exp: float):
+        self._revoked[token_hash] = exp
+        self._entries.pop(token_hash, None)
+
+    def is_revoked(self, token_hash: str) -> bool:
+        return token_hash in self._revoked
+
+    def prune(self):
+        """Drop revocations for tokens that have expired anyway"""
+        now = time.time()
+        for token_hash in [h for h, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[token_hash]
+
+    def clear(self):
+        self._entries.clear()
+        self._revoked.clear()
+
+# Global instance
+token_cache = TokenCache(int(os.getenv("TOKEN_CACHE_SIZE", "10000")))
+
 def create_access_token(user_id: str) -> str:
     expire = datetime.utcnow() + timedelta(days=7)
     payload = {
         "user_id": user_id,
         "exp": expire
     }
+    # PyJWT pulls in cryptography and urllib; import it on first use to keep startup cheap
+    import jwt
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def verify_token(token: str) -> Optional[str]:
+def decode_token(token: str) -> Optional[Dict[str, Any]]:
+    """Verify a token and return its cache entry, skipping the HMAC check on a cache hit"""
+    token_hash = hash_token(token)
+    if token_cache.is_revoked(token_hash):
+        return None
+    entry = token_cache.get(token_hash)
+    if entry:
+        return entry
+    import jwt
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("user_id")
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM],
+                             options={"require": ["exp"]})
     except jwt.ExpiredSignatureError:
         return None
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
+        return None
+    user_id = payload.get("user_id")
+    if user_id is None:
         return None
+    token_cache.put(token_hash, user_id, payload["exp"])
+    return token_cache.get(token_hash)
+
+def verify_token(token: str) -> Optional[str]:
+    entry = decode_token(token)
+    return entry["user_id"] if entry else None
+
+async def revoke_token(db, token: str):
+    """Revoke a token locally and record it so other workers pick it up"""
+    token_hash = hash_token(token)
+    entry = decode_token(token)
+    if not entry:
+        return
+    token_cache.revoke(token_hash, entry["exp"])
+    await db.revoke_token(token_hash, str(entry["user_id"]), datetime.utcfromtimestamp(entry["exp"]))
+
+# How far back each sync re-reads. revoked_at comes from the database clock,
+# but a revocation whose transaction commits late can still land behind the
+# cursor; re-reading a window catches it, and revoking twice is harmless.
+REVOCATION_SYNC_OVERLAP = timedelta(seconds=30)
+
+async def _sync_revocations_once(db, since: Optional[datetime]) -> Optional[datetime]:
+    """Apply revocations recorded at or after `since` minus the overlap and return the new cursor"""
+    rows = await db.get_revoked_tokens(since - REVOCATION_SYNC_OVERLAP if since else None)
+    for row in rows:
+        exp = row["expires_at"].replace(tzinfo=None) - datetime(1970, 1, 1)
+        token_cache.revoke(row["token_hash"], exp.total_seconds())
+        if since is None or row["revoked_at"] > since:
+            since = row["revoked_at"]
+    token_cache.prune()
+    return since
+
+async def sync_revocations(db, interval: float = 5.0):
+    """Keep the in-memory revocation set in step with the revoked_tokens table"""
+    since = None
+    while True:
+        try:
+            since = await _sync_revocations_once(db, since)
+        except Exception as e:
+            logger.warning(f"⚠️  AUTH: Failed to sync token revocations: {e}")
+        await asyncio.sleep(interval)
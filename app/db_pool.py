@@ -0,0 +1,134 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List
+
+logger = logging.getLogger(__name__)
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class ManagedPool:
+    """An asyncpg pool behind an adjustable concurrency limit.
+
+    asyncpg cannot resize a pool in place, so the pool is created at
+    `max_size` and callers are admitted up to `limit` at a time. The time
+    spent waiting for a slot and a connection is recorded per acquire;
+    resize() raises the limit while waits exceed `target_wait` and lowers it
+    again while the pool sits mostly idle, after which asyncpg closes the
+    surplus connections once they pass max_inactive_connection_lifetime.
+    """
+
+    def __init__(self, pool: Any, name: str, min_size: int, max_size: int, size: int = None,
+                 target_wait: float = 0.005, window: int = 1000):
+        self._pool = pool
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.limit = max(min_size, min(size or max_size, max_size))
+        self.target_wait = target_wait
+        self.in_use = 0
+        self.peak = 0
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.last_p95 = 0.0
+        self._waits: Deque[float] = deque(maxlen=window)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def load(self) -> float:
+        return (self.in_use + self.waiting) / self.limit
+
+    async def _take_slot(self):
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self._give_slot()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _give_slot(self):
+        self.in_use -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_use < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_use += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        await self._take_slot()
+        try:
+            conn = await self._pool.acquire()
+        except BaseException:
+            self._give_slot()
+            raise
+        wait = time.perf_counter() - started
+        self._waits.append(wait)
+        self.total_wait += wait
+        self.acquisitions += 1
+        self.peak = max(self.peak, self.in_use)
+        try:
+            yield conn
+        finally:
+            try:
+                await self._pool.release(conn)
+            finally:
+                self._give_slot()
+
+    def resize(self) -> int:
+        """Adjust the limit from the waits seen since the last call"""
+        p95 = _percentile(list(self._waits), 0.95)
+        self._waits.clear()
+        self.last_p95 = p95
+        peak, self.peak = self.peak, self.in_use
+
+        old = self.limit
+        if (p95 > self.target_wait or self.waiting) and self.limit < self.max_size:
+            self.limit = min(self.max_size, self.limit + max(1, self.limit // 4))
+            self._wake()
+        elif p95 <= self.target_wait / 4 and peak <= self.limit // 2 and self.limit > self.min_size:
+            self.limit -= 1
+        if self.limit != old:
+            logger.info(f"📏 DB: Pool {self.name} limit {old} -> {self.limit} (p95 wait {p95 * 1000:.1f}ms)")
+        return self.limit
+
+    def stats(self) -> Dict[str, Any]:
+        waits = list(self._waits)
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "acquisitions": self.acquisitions,
+            "wait_ms_total": round(self.total_wait * 1000, 3),
+            "wait_ms_p50": round(_percentile(waits, 0.5) * 1000, 3),
+            "wait_ms_p95": round((_percentile(waits, 0.95) if waits else self.last_p95) * 1000, 3),
+            "wait_ms_max": round(max(waits, default=0.0) * 1000, 3),
+        }
+
+    async def close(self):
+        await self._pool.close()
@@ -1,25 +1,80 @@
-
-from cryptography.fernet import Fernet
 import os
 import base64
+from typing import List, Optional, Tuple
+
+# Keys are read from the environment on first use rather than at import, so
+# importing this module stays cheap and never generates a key by accident.
+# ENCRYPTION_KEYS is a comma-separated list where the first key encrypts and
+# every key may decrypt, which is how keys are rotated: prepend the new key,
+# re-encrypt, then drop the old one.
+_keys: Optional[List[str]] = None
+_fernets: Optional[Tuple] = None
+
+# Every Fernet token starts with the 0x80 version byte, which base64url-encodes
+# to "gAAAAA". Rows written before the compact format wrapped the token in a
+# second layer of base64, so they start with the encoding of that prefix.
+_TOKEN_PREFIX = "gAAAAA"
+
+def get_keys() -> List[str]:
+    global _keys
+    if _keys is None:
+        keys = [k.strip() for k in os.getenv("ENCRYPTION_KEYS", "").split(",") if k.strip()]
+        key = os.getenv("ENCRYPTION_KEY")
+        if key and key not in keys:
+            keys.append(key)
+        if not keys:
+            from cryptography.fernet import Fernet
+            # Generate a key for development
+            key = Fernet.generate_key().decode()
+            keys = [key]
+            print(f"Generated encryption key: {key}")
+            print("Add this to your .env file as ENCRYPTION_KEY")
+        _keys = keys
+    return _keys
 
-# Get encryption key from environment
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
-if not ENCRYPTION_KEY:
-    # Generate a key for development
-    ENCRYPTION_KEY = Fernet.generate_key().decode()
-    print(f"Generated encryption key: {ENCRYPTION_KEY}")
-    print("Add this to your .env file as ENCRYPTION_KEY")
+def get_fernet():
+    """(primary Fernet, MultiFernet over all configured keys), built on first use"""
+    global _fernets
+    if _fernets is None:
+        from cryptography.fernet import Fernet, MultiFernet
+        keys = get_keys()
+        primary = Fernet(keys[0].encode())
+        _fernets = (primary, MultiFernet([primary] + [Fernet(k.encode()) for k in keys[1:]]))
+    return _fernets
 
-fernet = Fernet(ENCRYPTION_KEY.encode() if isinstance(ENCRYPTION_KEY, str) else ENCRYPTION_KEY)
+def has_rotated_keys() -> bool:
+    """True when old keys are still configured and stored data may need re-encryption"""
+    return len(get_keys()) > 1
+
+def is_legacy_format(encrypted_data: str) -> bool:
+    """True for values stored in the old double base64 encoded format"""
+    return not encrypted_data.startswith(_TOKEN_PREFIX)
+
+def _to_token(encrypted_data: str) -> bytes:
+    if is_legacy_format(encrypted_data):
+        return base64.b64decode(encrypted_data.encode())
+    return encrypted_data.encode()
 
 def encrypt_data(data: str) -> str:
     """Encrypt sensitive data like session tokens"""
-    encrypted = fernet.encrypt(data.encode())
-    return base64.b64encode(encrypted).decode()
+    return get_fernet()[1].encrypt(data.encode()).decode()
 
 def decrypt_data(encrypted_data: str) -> str:
-    """Decrypt sensitive data"""
-    decoded = base64.b64decode(encrypted_data.encode())
-    decrypted = fernet.decrypt(decoded)
+    """Decrypt sensitive data, accepting both the compact and legacy formats"""
+    decrypted = get_fernet()[1].decrypt(_to_token(encrypted_data))
     return decrypted.decode()
+
+def needs_reencryption(encrypted_data: str) -> bool:
+    """True when a stored value is in the legacy format or not under the primary key"""
+    from cryptography.fernet import InvalidToken
+    if is_legacy_format(encrypted_data):
+        return True
+    try:
+        get_fernet()[0].decrypt(encrypted_data.encode())
+        return False
+    except InvalidToken:
+        return True
+
+def reencrypt_data(encrypted_data: str) -> str:
+    """Re-encrypt a stored value under the primary key in the compact format"""
+    return get_fernet()[1].rotate(_to_token(encrypted_data)).decode()
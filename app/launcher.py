@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+import logging
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+def _run_worker(app: str, sock: socket.socket, worker_id: int, worker_count: int, ipc_dir: str):
+    os.environ["WORKER_ID"] = str(worker_id)
+    os.environ["WORKER_COUNT"] = str(worker_count)
+    os.environ["IPC_DIR"] = ipc_dir
+    # start_auth and verify_auth may land on different workers
+    os.environ.setdefault("PENDING_AUTH_STORE", "database")
+    config = uvicorn.Config(app)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def run(app: str = "main:app", host: str = "0.0.0.0", port: int = 5000, workers: int = None):
+    """Start the API, either as one reloading dev server or as N workers sharing one socket.
+
+    Workers are numbered 0..N-1 and talk over the IPC bus in IPC_DIR; each
+    Telegram account is owned by the worker its id hashes to. Crashed
+    workers are restarted with the same id so ownership stays put.
+    """
+    workers = workers or int(os.getenv("WORKERS", "1"))
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port, reload=True)
+        return
+
+    ipc_dir = os.getenv("IPC_DIR", os.path.join(tempfile.gettempdir(), f"crossmessenger-ipc-{os.getpid()}"))
+    os.makedirs(ipc_dir, exist_ok=True)
+    sock = uvicorn.Config(app, host=host, port=port).bind_socket()
+    ctx = multiprocessing.get_context("spawn")
+
+    def spawn(worker_id: int):
+        process = ctx.Process(target=_run_worker, args=(app, sock, worker_id, workers, ipc_dir), name=f"worker-{worker_id}")
+        process.start()
+        return process
+
+    processes = [spawn(i) for i in range(workers)]
+    logger.info(f"🚀 LAUNCHER: Started {workers} workers on {host}:{port}")
+
+    stopping = False
+    def handle_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        while not stopping:
+            for worker_id, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning(f"⚠️  LAUNCHER: Worker {worker_id} exited with {process.exitcode}, restarting")
+                    processes[worker_id] = spawn(worker_id)
+            time.sleep(1)
+    finally:
+        logger.info("🛑 LAUNCHER: Stopping workers...")
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+        sock.close()
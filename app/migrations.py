@@ -0,0 +1,524 @@
+import argparse
+import asyncio
+import os
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant key for pg_advisory_lock so only one runner migrates at a time
+MIGRATION_LOCK_ID = 735_001
+
+class Index:
+    """An index built without blocking writes (CREATE INDEX CONCURRENTLY on PostgreSQL)"""
+
+    def __init__(self, name: str, definition: str):
+        self.name = name
+        self.definition = definition
+
+class Backfill:
+    """A data update run in keyset batches over `table`.id with a pause between batches.
+
+    `postgres` and `sqlite` statements take the exclusive lower and inclusive
+    upper id of the batch as their two parameters.
+    """
+
+    def __init__(self, table: str, postgres: str, sqlite: str):
+        self.table = table
+        self.postgres = postgres
+        self.sqlite = sqlite
+
+class Migration:
+    """One schema version.
+
+    `postgres`/`sqlite` statements run first, in a single transaction. Then
+    `indexes` are built concurrently outside of any transaction and `backfill`
+    runs in throttled batches, so both can rely on columns the statements add.
+    Migrations with indexes or a backfill are marked background and skipped at
+    app startup, so booting never waits on a full table scan.
+
+    The version is recorded with the statements when there is nothing else to
+    do, otherwise only after the indexes and backfill finish. An interrupted
+    run then repeats the statements, so those must be re-runnable (IF NOT EXISTS).
+    """
+
+    def __init__(self, version: int, name: str, postgres: List[str] = None, sqlite: List[str] = None,
+                 indexes: List[Index] = None, backfill: Optional[Backfill] = None):
+        self.version = version
+        self.name = name
+        self.postgres = postgres or []
+        self.sqlite = sqlite or []
+        self.indexes = indexes or []
+        self.backfill = backfill
+
+    @property
+    def background(self) -> bool:
+        return self.backfill is not None or bool(self.indexes)
+
+POSTGRES_BASELINE = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        platform VARCHAR(50) NOT NULL,
+        platform_account_id VARCHAR(255) NOT NULL,
+        session_encrypted TEXT,
+        created_at TIMESTAMP DEFAULT NOW(),
+        UNIQUE(user_id, platform, platform_account_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chats (
+        id SERIAL PRIMARY KEY,
+        account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+        chat_id VARCHAR(255) NOT NULL,
+        title VARCHAR(255),
+        last_message_at TIMESTAMP DEFAULT NOW(),
+        UNIQUE(account_id, chat_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id SERIAL PRIMARY KEY,
+        chat_id VARCHAR(255) NOT NULL,
+        platform VARCHAR(50) NOT NULL,
+        platform_message_id VARCHAR(255),
+        sender_id VARCHAR(255),
+        sender_name VARCHAR(255),
+        text TEXT,
+        attachments_json TEXT DEFAULT '[]',
+        timestamp TIMESTAMP DEFAULT NOW(),
+        status VARCHAR(50) DEFAULT 'sent'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        token_hash VARCHAR(64) PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        expires_at TIMESTAMP NOT NULL,
+        revoked_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS contacts (
+        account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+        entity_id VARCHAR(255) NOT NULL,
+        display_name VARCHAR(255),
+        entity_type VARCHAR(50),
+        avatar_ref VARCHAR(255),
+        updated_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (account_id, entity_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cluster_nodes (
+        node_id VARCHAR(255) PRIMARY KEY,
+        address VARCHAR(255) NOT NULL,
+        heartbeat_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS account_leases (
+        account_id INTEGER PRIMARY KEY REFERENCES accounts(id) ON DELETE CASCADE,
+        node_id VARCHAR(255) NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        text TEXT,
+        total INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_targets (
+        broadcast_id INTEGER REFERENCES broadcasts(id) ON DELETE CASCADE,
+        target_index INTEGER NOT NULL,
+        platform VARCHAR(50) NOT NULL,
+        account_id VARCHAR(255),
+        chat_id VARCHAR(255) NOT NULL,
+        status VARCHAR(50) DEFAULT 'pending',
+        message_id VARCHAR(255),
+        error TEXT,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (broadcast_id, target_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pending_auth (
+        user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+        phone VARCHAR(50) NOT NULL,
+        phone_code_hash VARCHAR(255) NOT NULL,
+        session_encrypted TEXT NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,
+]
+
+SQLITE_BASELINE = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        platform VARCHAR(50) NOT NULL,
+        platform_account_id VARCHAR(255) NOT NULL,
+        session_encrypted TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, platform, platform_account_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+        chat_id VARCHAR(255) NOT NULL,
+        title VARCHAR(255),
+        last_message_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(account_id, chat_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id VARCHAR(255) NOT NULL,
+        platform VARCHAR(50) NOT NULL,
+        platform_message_id VARCHAR(255),
+        sender_id VARCHAR(255),
+        sender_name VARCHAR(255),
+        text TEXT,
+        attachments_json TEXT DEFAULT '[]',
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status VARCHAR(50) DEFAULT 'sent'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        token_hash VARCHAR(64) PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        expires_at TIMESTAMP NOT NULL,
+        revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS contacts (
+        account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+        entity_id VARCHAR(255) NOT NULL,
+        display_name VARCHAR(255),
+        entity_type VARCHAR(50),
+        avatar_ref VARCHAR(255),
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (account_id, entity_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        text TEXT,
+        total INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_targets (
+        broadcast_id INTEGER REFERENCES broadcasts(id) ON DELETE CASCADE,
+        target_index INTEGER NOT NULL,
+        platform VARCHAR(50) NOT NULL,
+        account_id VARCHAR(255),
+        chat_id VARCHAR(255) NOT NULL,
+        status VARCHAR(50) DEFAULT 'pending',
+        message_id VARCHAR(255),
+        error TEXT,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (broadcast_id, target_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pending_auth (
+        user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+        phone VARCHAR(50) NOT NULL,
+        phone_code_hash VARCHAR(255) NOT NULL,
+        session_encrypted TEXT NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,]
+
+MIGRATIONS = [
+    # Existing deployments already have these tables; IF NOT EXISTS lets them adopt version 1
+    Migration(1, "baseline", postgres=POSTGRES_BASELINE, sqlite=SQLITE_BASELINE),
+    Migration(2, "messages_chat_timeline_index", indexes=[
+        Index("idx_messages_chat_timeline", "messages (chat_id, timestamp DESC, id DESC)"),
+    ]),
+    Migration(3, "messages_platform_message_index", indexes=[
+        Index("idx_messages_platform_message", "messages (chat_id, platform_message_id)"),
+    ]),
+    # chats.last_message_at was only ever set when the chat row was created
+    Migration(4, "backfill_chats_last_message_at", backfill=Backfill(
+        "chats",
+        postgres="""
+            UPDATE chats SET last_message_at = COALESCE(
+                (SELECT MAX(timestamp) FROM messages WHERE messages.chat_id = chats.chat_id),
+                last_message_at
+            ) WHERE id > $1 AND id <= $2
+        """,
+        sqlite="""
+            UPDATE chats SET last_message_at = COALESCE(
+                (SELECT MAX(timestamp) FROM messages WHERE messages.chat_id = chats.chat_id),
+                last_message_at
+            ) WHERE id > ? AND id <= ?
+        """,
+    )),
+    Migration(5, "messages_edited_at",
+              postgres=["ALTER TABLE messages ADD COLUMN IF NOT EXISTS edited_at TIMESTAMP"],
+              sqlite=["ALTER TABLE messages ADD COLUMN edited_at TIMESTAMP"]),
+    # Internal chats have no chats row; the inbox found them by scanning messages
+    Migration(6, "internal_chat_members", postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS internal_chat_members (
+            chat_id VARCHAR(255) NOT NULL,
+            user_id VARCHAR(255) NOT NULL,
+            PRIMARY KEY (user_id, chat_id)
+        )
+        """,
+        """
+        INSERT INTO internal_chat_members (chat_id, user_id)
+        SELECT DISTINCT chat_id, split_part(chat_id, '_', n) FROM messages
+        CROSS JOIN (VALUES (2), (3)) AS part(n)
+        WHERE platform = 'internal' AND chat_id LIKE 'internal\\_%\\_%'
+        ON CONFLICT DO NOTHING
+        """,
+    ], sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS internal_chat_members (
+            chat_id VARCHAR(255) NOT NULL,
+            user_id VARCHAR(255) NOT NULL,
+            PRIMARY KEY (user_id, chat_id)
+        )
+        """,
+    ]),
+]
+
+class MigrationRunner:
+    def __init__(self, db, migrations: List[Migration] = None, batch_size: int = 1000, throttle: float = 0.05,
+                 lock_poll_interval: float = 0.5):
+        self.db = db
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.lock_poll_interval = lock_poll_interval
+
+    @property
+    def postgres(self) -> bool:
+        return self.db.pool is not None
+
+    # Connection helpers: asyncpg pool on PostgreSQL, a fresh aiosqlite connection otherwise
+
+    def _sqlite(self):
+        import aiosqlite
+        return aiosqlite.connect(self.db.sqlite_db)
+
+    async def _ensure_table(self):
+        sql = """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            )
+        """
+        if self.postgres:
+            async with self.db.pool.acquire() as conn:
+                await conn.execute(sql)
+        else:
+            async with self._sqlite() as conn:
+                await conn.execute(sql)
+                await conn.commit()
+
+    async def applied_versions(self) -> Set[int]:
+        await self._ensure_table()
+        if self.postgres:
+            async with self.db.pool.acquire() as conn:
+                rows = await conn.fetch("SELECT version FROM schema_migrations")
+                return {row['version'] for row in rows}
+        async with self._sqlite() as conn:
+            cursor = await conn.execute("SELECT version FROM schema_migrations")
+            return {row[0] for row in await cursor.fetchall()}
+
+    async def pending(self, include_background: bool = True) -> List[Migration]:
+        applied = await self.applied_versions()
+        return [m for m in self.migrations
+                if m.version not in applied and (include_background or not m.background)]
+
+    async def _record(self, conn, migration: Migration):
+        if self.postgres:
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES ($1, $2, $3)",
+                migration.version, migration.name, datetime.utcnow()
+            )
+        else:
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.name, datetime.utcnow().isoformat())
+            )
+
+    async def _build_index_postgres(self, conn, index: Index):
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would skip
+        invalid = await conn.fetchval(
+            """SELECT NOT i.indisvalid FROM pg_index i
+               JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = $1""",
+            index.name
+        )
+        if invalid:
+            logger.warning(f"⚠️  MIGRATE: Dropping invalid index {index.name}")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}")
+        await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {index.definition}")
+
+    async def _run_backfill(self, backfill: Backfill) -> int:
+        last_id, updated = 0, 0
+        while True:
+            if self.postgres:
+                async with self.db.pool.acquire() as conn:
+                    upper = await conn.fetchval(
+                        f"SELECT MAX(id) FROM (SELECT id FROM {backfill.table} WHERE id > $1 ORDER BY id LIMIT $2) batch",
+                        last_id, self.batch_size
+                    )
+                    if upper is None:
+                        break
+                    await conn.execute(backfill.postgres, last_id, upper)
+            else:
+                async with self._sqlite() as conn:
+                    cursor = await conn.execute(
+                        f"SELECT MAX(id) FROM (SELECT id FROM {backfill.table} WHERE id > ? ORDER BY id LIMIT ?)",
+                        (last_id, self.batch_size)
+                    )
+                    upper = (await cursor.fetchone())[0]
+                    if upper is None:
+                        break
+                    await conn.execute(backfill.sqlite, (last_id, upper))
+                    await conn.commit()
+            updated += 1
+            last_id = upper
+            # Give foreground traffic room between batches
+            await asyncio.sleep(self.throttle)
+        return updated
+
+    async def _run_statements(self, migration: Migration, record: bool):
+        if self.postgres:
+            async with self.db.pool.acquire() as conn:
+                async with conn.transaction():
+                    for statement in migration.postgres:
+                        await conn.execute(statement)
+                    if record:
+                        await self._record(conn, migration)
+        else:
+            async with self._sqlite() as conn:
+                for statement in migration.sqlite:
+                    await conn.execute(statement)
+                if record:
+                    await self._record(conn, migration)
+                await conn.commit()
+
+    async def apply(self, migration: Migration):
+        logger.info(f"🔧 MIGRATE: Applying {migration.version} {migration.name}")
+        deferred = bool(migration.indexes or migration.backfill)
+        # Statements first: the indexes and the backfill may use what they create
+        await self._run_statements(migration, record=not deferred)
+        if not deferred:
+            return
+
+        if self.postgres:
+            async with self.db.pool.acquire() as conn:
+                for index in migration.indexes:
+                    await self._build_index_postgres(conn, index)
+        else:
+            async with self._sqlite() as conn:
+                for index in migration.indexes:
+                    await conn.execute(f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.definition}")
+                await conn.commit()
+
+        if migration.backfill:
+            batches = await self._run_backfill(migration.backfill)
+            logger.info(f"✅ MIGRATE: Backfilled {migration.backfill.table} in {batches} batches")
+
+        # Recorded last, so an interrupted index build or backfill is retried on the next run
+        if self.postgres:
+            async with self.db.pool.acquire() as conn:
+                await self._record(conn, migration)
+        else:
+            async with self._sqlite() as conn:
+                await self._record(conn, migration)
+                await conn.commit()
+
+    async def _migrate(self, include_background: bool) -> List[int]:
+        applied = []
+        for migration in await self.pending(include_background):
+            await self.apply(migration)
+            applied.append(migration.version)
+        skipped = [m.version for m in await self.pending(True) if m.background]
+        if skipped and not include_background:
+            logger.info(f"ℹ️  MIGRATE: Background migrations {skipped} pending; run `python -m app.migrations migrate`")
+        return applied
+
+    async def migrate(self, include_background: bool = True) -> List[int]:
+        if not self.postgres:
+            return await self._migrate(include_background)
+        # Held on its own connection for the whole run; a session-level lock
+        # survives the concurrent index builds, which cannot run in a transaction
+        async with self.db.pool.acquire() as lock:
+            # Poll rather than block in pg_advisory_lock: a waiting statement holds
+            # a snapshot, and CREATE INDEX CONCURRENTLY in the holder waits for
+            # every older snapshot to finish, which would deadlock the two
+            while not await lock.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+                await asyncio.sleep(self.lock_poll_interval)
+            try:
+                return await self._migrate(include_background)
+            finally:
+                await lock.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+async def migrate(db, include_background: bool = True, **kwargs) -> List[int]:
+    return await MigrationRunner(db, **kwargs).migrate(include_background)
+
+async def _main(args):
+    from app.database import Database
+    db = Database()
+    await db.init_pool()
+    if not db.pool:
+        db.sqlite_db = "crossmessenger.db"
+    runner = MigrationRunner(db, batch_size=args.batch_size, throttle=args.throttle)
+    if args.command == "status":
+        applied = await runner.applied_versions()
+        for m in runner.migrations:
+            state = "applied" if m.version in applied else "pending"
+            print(f"{m.version:>4}  {state:<8} {m.name}{' (background)' if m.background else ''}")
+    else:
+        applied = await runner.migrate(include_background=True)
+        print(f"Applied {applied or 'nothing'}")
+    await db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run CrossMessenger schema migrations")
+    parser.add_argument("command", choices=["migrate", "status"], nargs="?", default="migrate")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("MIGRATION_BATCH_SIZE", "1000")))
+    parser.add_argument("--throttle", type=float, default=float(os.getenv("MIGRATION_THROTTLE", "0.05")),
+                        help="Seconds to sleep between backfill batches")
+    asyncio.run(_main(parser.parse_args()))
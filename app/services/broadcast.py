@@ -0,0 +1,108 @@
+import asyncio
+import time
+import logging
+from typing import Any, Dict, List, Optional, Set
+from app.database import internal_chat_members
+
+logger = logging.getLogger(__name__)
+
+class BroadcastService:
+    """Sends one message to many chats in the background.
+
+    Targets are grouped by platform and handed to that service's dispatcher;
+    per-target results are buffered and written back in bulk, and each flush
+    pushes a broadcast:progress event to the user's WebSockets.
+    """
+
+    def __init__(self, db, telegram_service, instagram_service, websocket_manager,
+                 flush_size: int = 50, flush_interval: float = 1.0):
+        self.db = db
+        self.telegram_service = telegram_service
+        self.instagram_service = instagram_service
+        self.websocket_manager = websocket_manager
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self, user_id: str, text: str, targets: List[Dict[str, Any]]) -> str:
+        for index, target in enumerate(targets):
+            target["index"] = index
+        broadcast_id = await self.db.create_broadcast(user_id, text, targets)
+        task = asyncio.create_task(self._run(broadcast_id, user_id, text, targets))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return broadcast_id
+
+    async def _run(self, broadcast_id: str, user_id: Any, text: str, targets: List[Dict[str, Any]]):
+        # The integer id goes to the database; sockets and dispatch are keyed by its string form
+        socket_user = str(user_id)
+        progress = {"sent": 0, "failed": 0, "total": len(targets)}
+        pending: List[Dict[str, Any]] = []
+        last_flush = time.monotonic()
+
+        async def flush():
+            nonlocal pending, last_flush
+            batch, pending = pending, []
+            last_flush = time.monotonic()
+            if batch:
+                await self.db.update_broadcast_targets(broadcast_id, batch)
+            await self.websocket_manager.send_to_user(socket_user, {
+                "type": "broadcast:progress", "broadcast_id": broadcast_id, **progress
+            })
+
+        async def on_result(target: Dict[str, Any], message_id: Optional[str], error: Optional[str]):
+            progress["sent" if error is None else "failed"] += 1
+            pending.append({
+                "index": target["index"],
+                "status": "sent" if error is None else "failed",
+                "message_id": message_id,
+                "error": error,
+            })
+            if len(pending) >= self.flush_size or time.monotonic() - last_flush >= self.flush_interval:
+                await flush()
+
+        try:
+            # Only the user's own accounts and internal chats may be used; accounts checked with one lookup
+            account_ids = {str(a["id"]) for a in await self.db.get_user_accounts(user_id)}
+            by_platform: Dict[str, List[Dict[str, Any]]] = {}
+            for target in targets:
+                if target["platform"] == "internal":
+                    # Internal chats are only open to the two users named in them
+                    if socket_user not in (internal_chat_members(target["chat_id"]) or ()):
+                        await on_result(target, None, "Chat not found")
+                    else:
+                        by_platform.setdefault("internal", []).append(target)
+                elif str(target["account_id"]) not in account_ids:
+                    await on_result(target, None, "Account not found")
+                else:
+                    by_platform.setdefault(target["platform"], []).append(target)
+
+            jobs = []
+            if "telegram" in by_platform:
+                jobs.append(self.telegram_service.send_many(socket_user, by_platform["telegram"], text, on_result))
+            if "instagram" in by_platform:
+                jobs.append(self.instagram_service.send_many(socket_user, by_platform["instagram"], text, on_result))
+            if "internal" in by_platform:
+                jobs.append(self._send_internal(user_id, by_platform["internal"], text, on_result))
+            await asyncio.gather(*jobs)
+        except Exception as e:
+            logger.error(f"❌ BROADCAST {broadcast_id}: {e}")
+        finally:
+            await flush()
+            await self.websocket_manager.send_to_user(socket_user, {
+                "type": "broadcast:done", "broadcast_id": broadcast_id, **progress
+            })
+            logger.info(f"✅ BROADCAST {broadcast_id}: {progress['sent']} sent, {progress['failed']} failed")
+
+    async def _send_internal(self, user_id: str, targets: List[Dict[str, Any]], text: str, on_result):
+        for target in targets:
+            try:
+                message_id = await self.db.send_internal_message(user_id, target["chat_id"], text)
+            except Exception as e:
+                await on_result(target, None, str(e))
+                continue
+            await on_result(target, message_id, None)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
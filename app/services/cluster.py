@@ -0,0 +1,184 @@
+import asyncio
+import os
+import socket
+import time
+import logging
+from typing import Any, Dict, List, Optional, Set
+from app.services.hash_ring import HashRing
+
+logger = logging.getLogger(__name__)
+
+class ClusterCoordinator:
+    """Distributes Telegram account ownership across nodes.
+
+    Nodes heartbeat into cluster_nodes and the live set forms a consistent-hash
+    ring. A node only connects an account after winning its row in
+    account_leases, renews its leases every tick, and releases a lease only
+    after draining the client, so an account never has two live owners. When
+    a node dies its leases expire and the ring's new owners take over.
+    """
+
+    def __init__(self, db, telegram_service, node_id: str, address: str,
+                 lease_ttl: float = 30, interval: float = 10, max_attach_per_tick: int = 50):
+        self.db = db
+        self.telegram_service = telegram_service
+        self.node_id = node_id
+        self.address = address
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.max_attach_per_tick = max_attach_per_tick
+        self.secret = os.getenv("CLUSTER_SECRET", "")
+        self.ring = HashRing([node_id])
+        self.owned: Set[str] = set()
+        # Leases are known to be ours until this monotonic deadline
+        self.lease_deadline = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._session = None
+
+    def owns(self, account_id: str) -> bool:
+        return str(account_id) in self.owned
+
+    async def confirm(self, account_id: str) -> bool:
+        """Whether this node may act for the account right now.
+
+        Past the last renewal's deadline (a stalled loop or a DB outage) the
+        lease may have passed to another node, so ask the database and drop
+        the account locally if it did.
+        """
+        account_id = str(account_id)
+        if account_id not in self.owned:
+            return False
+        if time.monotonic() < self.lease_deadline:
+            return True
+        owner = await self.db.get_account_owner(account_id)
+        if owner and owner["node_id"] == self.node_id:
+            return True
+        await self._lose(account_id)
+        return False
+
+    async def _lose(self, account_id: str):
+        """Stop serving an account whose lease another node now holds; the lease is not ours to release"""
+        self.owned.discard(account_id)
+        await self.telegram_service.detach_account(account_id)
+        logger.warning(f"⚠️  CLUSTER: Lost lease on account {account_id}, detached")
+
+    def _rebuild_ring(self, node_ids: List[str]):
+        if set(node_ids) != set(self.ring.nodes):
+            logger.info(f"🔄 CLUSTER: Live nodes changed to {sorted(node_ids)}")
+            self.ring = HashRing(node_ids)
+
+    async def _attach(self, account_id: str) -> bool:
+        if not await self.db.acquire_account_lease(account_id, self.node_id, self.lease_ttl):
+            return False
+        try:
+            await self.telegram_service.attach_account(account_id)
+            self.owned.add(account_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ CLUSTER: Failed to attach account {account_id}: {e}")
+            await self.db.release_account_lease(account_id, self.node_id)
+            return False
+
+    async def handoff(self, account_id: str):
+        """Drain the local client, then release the lease so the new owner can connect"""
+        await self.telegram_service.detach_account(account_id)
+        self.owned.discard(account_id)
+        await self.db.release_account_lease(account_id, self.node_id)
+        logger.info(f"➡️  CLUSTER: Handed off account {account_id}")
+
+    async def claim(self, account_id: str) -> bool:
+        """Take a freshly connected account if this node is its owner on the ring"""
+        account_id = str(account_id)
+        if self.ring.get(account_id) != self.node_id:
+            return False
+        if not await self.db.acquire_account_lease(account_id, self.node_id, self.lease_ttl):
+            return False
+        self.owned.add(account_id)
+        return True
+
+    async def tick(self):
+        await self.db.heartbeat_node(self.node_id, self.address)
+        nodes = await self.db.get_live_nodes(self.lease_ttl)
+        self._rebuild_ring([n["node_id"] for n in nodes] or [self.node_id])
+        renewed_at = time.monotonic()
+        renewed = set(await self.db.renew_account_leases(self.node_id, self.lease_ttl))
+        self.lease_deadline = renewed_at + self.lease_ttl
+        # Leases that lapsed while this node stalled may already belong to another node
+        for account_id in self.owned - renewed:
+            await self._lose(account_id)
+
+        account_ids = [str(a) for a in await self.db.get_account_ids("telegram")]
+        attached = 0
+        for account_id in account_ids:
+            if self.ring.get(account_id) == self.node_id:
+                # Spread takeovers over several ticks to avoid a reconnect storm
+                if account_id not in self.owned and attached < self.max_attach_per_tick:
+                    if await self._attach(account_id):
+                        attached += 1
+            elif account_id in self.owned:
+                await self.handoff(account_id)
+
+        for account_id in self.owned - set(account_ids):
+            await self.handoff(account_id)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"❌ CLUSTER: Tick failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"✅ CLUSTER: Node {self.node_id} joined at {self.address}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for account_id in list(self.owned):
+            try:
+                await self.handoff(account_id)
+            except Exception as e:
+                logger.warning(f"⚠️  CLUSTER: Failed to hand off account {account_id}: {e}")
+        await self.db.remove_node(self.node_id)
+        if self._session:
+            await self._session.close()
+            self._session = None
+        logger.info(f"🛑 CLUSTER: Node {self.node_id} left")
+
+    async def forward_send(self, payload: Dict[str, Any]) -> str:
+        """Forward a send to the node that currently holds the account's lease"""
+        owner = await self.db.get_account_owner(payload["account_id"])
+        if not owner:
+            raise Exception("Account is not currently owned by any node")
+        if owner["node_id"] == self.node_id:
+            raise Exception("Account lease is held by this node but the account is not attached")
+        if self._session is None:
+            import aiohttp
+            # One session for the coordinator's lifetime keeps connections to peers alive
+            self._session = aiohttp.ClientSession()
+        async with self._session.post(
+            f"{owner['address']}/api/internal/telegram/send",
+            json=payload, headers={"X-Cluster-Secret": self.secret}
+        ) as resp:
+            result = await resp.json()
+            if resp.status != 200:
+                raise Exception(result.get("detail", "Forwarded send failed"))
+            return result["message_id"]
+
+def cluster_from_env(db, telegram_service) -> Optional[ClusterCoordinator]:
+    """Build the coordinator when CLUSTER_MODE is set"""
+    if not os.getenv("CLUSTER_MODE"):
+        return None
+    if os.getenv("WORKER_COUNT", "1") != "1":
+        # Forwarded sends are addressed to a node, so each node must be a single process
+        raise Exception("CLUSTER_MODE runs one worker per node; start more nodes instead of WORKERS")
+    node_id = os.getenv("NODE_ID", f"{socket.gethostname()}-{os.getpid()}")
+    return ClusterCoordinator(
+        db, telegram_service, node_id,
+        os.getenv("NODE_ADDRESS", f"http://{socket.gethostname()}:{os.getenv('PORT', '5000')}"),
+        lease_ttl=float(os.getenv("CLUSTER_LEASE_TTL", "30")),
+        interval=float(os.getenv("CLUSTER_INTERVAL", "10")),
+    )
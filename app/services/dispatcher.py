@@ -0,0 +1,76 @@
+import asyncio
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Token bucket: `rate` sends per second with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Push the bucket into debt, e.g. after the platform asked us to back off"""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class SendDispatcher:
+    """Runs many sends with a concurrency cap and a per-account rate limit.
+
+    `retry_after` maps a send exception to a back-off in seconds (e.g. a
+    Telegram FloodWaitError); such sends pause that account and are retried.
+    """
+
+    def __init__(self, concurrency: int = 8, per_account_rate: float = 20.0,
+                 retry_after: Optional[Callable[[Exception], Optional[float]]] = None,
+                 max_retries: int = 2):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_account_rate = per_account_rate
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def _limiter(self, account_id: str) -> RateLimiter:
+        limiter = self._limiters.get(account_id)
+        if limiter is None:
+            limiter = self._limiters[account_id] = RateLimiter(self.per_account_rate)
+        return limiter
+
+    async def _send_one(self, target: Dict[str, Any], send: Callable[[Dict[str, Any]], Awaitable[str]],
+                        on_result: Callable[[Dict[str, Any], Optional[str], Optional[str]], Awaitable[None]]):
+        limiter = self._limiter(str(target["account_id"]))
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            try:
+                async with self.semaphore:
+                    message_id = await send(target)
+            except Exception as e:
+                delay = self.retry_after(e) if self.retry_after else None
+                if delay is None or attempt == self.max_retries:
+                    await on_result(target, None, str(e))
+                    return
+                logger.warning(f"⏳ DISPATCH: Account {target['account_id']} rate limited, retrying in {delay}s")
+                limiter.pause(delay)
+                continue
+            await on_result(target, message_id, None)
+            return
+
+    async def run(self, targets: List[Dict[str, Any]], send: Callable[[Dict[str, Any]], Awaitable[str]],
+                  on_result: Callable[[Dict[str, Any], Optional[str], Optional[str]], Awaitable[None]]):
+        await asyncio.gather(*(self._send_one(t, send, on_result) for t in targets))
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+def describe_entity(entity: Any) -> Dict[str, Any]:
+    """Reduce a Telethon User/Chat/Channel to the fields we show for a sender"""
+    name = getattr(entity, 'first_name', '') or getattr(entity, 'title', 'Unknown')
+    photo = getattr(entity, 'photo', None)
+    photo_id = getattr(photo, 'photo_id', None)
+    return {
+        "id": str(entity.id),
+        "name": name or "Unknown",
+        "type": type(entity).__name__.lower(),
+        "avatar": str(photo_id) if photo_id else None,
+    }
+
+class EntityCache:
+    """Per-account LRU of sender/chat entities (id -> name, type, avatar ref).
+
+    Entries that changed since the last flush are tracked in `dirty` so they
+    can be persisted to the contacts table in one batch.
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.dirty: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, entity_id: Any) -> Optional[Dict[str, Any]]:
+        entity_id = str(entity_id)
+        entry = self._entries.get(entity_id)
+        if entry:
+            self._entries.move_to_end(entity_id)
+        return entry
+
+    def _store(self, entry: Dict[str, Any], dirty: bool):
+        entity_id = entry["id"]
+        if self._entries.get(entity_id) != entry:
+            self._entries[entity_id] = entry
+            if dirty:
+                self.dirty.add(entity_id)
+        self._entries.move_to_end(entity_id)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self.dirty.discard(evicted)
+
+    def put(self, entity: Any) -> Dict[str, Any]:
+        entry = describe_entity(entity)
+        self._store(entry, dirty=True)
+        return self._entries[entry["id"]]
+
+    def rename(self, entity_id: Any, name: str):
+        entry = self.get(entity_id)
+        if entry and name and entry["name"] != name:
+            self._store({**entry, "name": name}, dirty=True)
+
+    def load(self, rows: List[Dict[str, Any]]):
+        """Warm from persisted contacts without marking them dirty"""
+        for row in rows:
+            self._store({
+                "id": str(row["entity_id"]),
+                "name": row["display_name"],
+                "type": row["entity_type"],
+                "avatar": row["avatar_ref"],
+            }, dirty=False)
+
+    def take_dirty(self) -> List[Dict[str, Any]]:
+        entries = [self._entries[i] for i in self.dirty if i in self._entries]
+        self.dirty.clear()
+        return entries
@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+class HashRing:
+    """Consistent-hash ring mapping keys (account ids) to owner nodes.
+
+    Each node is placed on the ring at `replicas` virtual points so keys
+    spread evenly and only ~1/N of them move when a node joins or leaves.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def add(self, node: str):
+        node = str(node)
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            bisect.insort(self._points, point)
+            self._owners[point] = node
+
+    def remove(self, node: str):
+        node = str(node)
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            del self._owners[point]
+            self._points.remove(point)
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(str(key))) % len(self._points)
+        return self._owners[self._points[index]]
@@ -0,0 +1,75 @@
+import base64
+import heapq
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps({"ts": row["timestamp"].isoformat(), "id": row["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["ts"]), int(data["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _sort_key(row: Dict[str, Any]) -> Tuple[float, int]:
+    # heapq is a min-heap, so negate to pop the newest message first
+    return (-row["timestamp"].timestamp(), -row["id"])
+
+class InboxService:
+    """Builds one time-ordered stream over all of a user's chats.
+
+    Each chat is read through its own cursor on the (chat_id, timestamp, id)
+    index, `batch_size` rows at a time, and the per-chat streams are k-way
+    merged with a heap. Only chats whose head is actually consumed are read
+    further, so a page costs about k small index scans instead of sorting
+    every message the user has.
+    """
+
+    def __init__(self, db, batch_size: int = 20):
+        self.db = db
+        self.batch_size = batch_size
+
+    async def get_inbox(self, user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                        platforms: Optional[List[str]] = None) -> Dict[str, Any]:
+        before = decode_cursor(cursor) if cursor else None
+        chats = await self.db.get_user_inbox_chats(user_id, platforms)
+        chat_ids = list(dict.fromkeys(chat["chat_id"] for chat in chats))
+        if not chat_ids:
+            return {"messages": [], "next_cursor": None}
+
+        batch = min(self.batch_size, limit)
+        pages = await self.db.get_chat_message_pages(chat_ids, before, batch)
+        heap = []
+        for chat_id, rows in pages.items():
+            if rows:
+                heapq.heappush(heap, (_sort_key(rows[0]), chat_id, 0))
+
+        messages = []
+        while heap and len(messages) < limit:
+            _, chat_id, index = heapq.heappop(heap)
+            rows = pages[chat_id]
+            row = rows[index]
+            messages.append(row)
+            index += 1
+            if index == len(rows) and len(rows) == batch:
+                # This chat's buffered rows are used up; read its next batch
+                rows = (await self.db.get_chat_message_pages(
+                    [chat_id], (row["timestamp"], row["id"]), batch
+                )).get(chat_id, [])
+                pages[chat_id] = rows
+                index = 0
+            if index < len(rows):
+                heapq.heappush(heap, (_sort_key(rows[index]), chat_id, index))
+
+        for message in messages:
+            message['attachments'] = json.loads(message.get('attachments_json') or '[]')
+        next_cursor = encode_cursor(messages[-1]) if heap and messages else None
+        return {"messages": messages, "next_cursor": next_cursor}
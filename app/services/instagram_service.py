@@ -2,9 +2,10 @@
 import aiohttp
 import os
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from urllib.parse import urlencode
 from app.encryption import encrypt_data, decrypt_data
+from app.services.dispatcher import SendDispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,10 @@ class InstagramService:
         self.app_id = os.getenv("FACEBOOK_APP_ID", "")
         self.app_secret = os.getenv("FACEBOOK_APP_SECRET", "")
         self.redirect_uri = f"{os.getenv('BACKEND_URL', 'http://0.0.0.0:5000')}/api/auth/instagram/callback"
+        self.dispatcher = SendDispatcher(
+            concurrency=int(os.getenv("INSTAGRAM_SEND_CONCURRENCY", "4")),
+            per_account_rate=float(os.getenv("INSTAGRAM_SEND_RATE", "5"))
+        )
         
     def get_auth_url(self, user_id: str) -> str:
         params = {
@@ -56,7 +61,7 @@ class InstagramService:
                 )
                 
                 # Load mock chats (since Instagram DM access is limited)
-                await self._load_mock_chats(account_id)
+                await self._load_mock_chats(user_id, account_id)
                 
                 return account_id
                 
@@ -64,7 +69,7 @@ class InstagramService:
             logger.error(f"Error handling Instagram callback: {e}")
             raise e
             
-    async def _load_mock_chats(self, account_id: str):
+    async def _load_mock_chats(self, user_id: str, account_id: str):
         """Load mock chats since Instagram DM access is limited in Graph API"""
         mock_chats = [
             {"id": "instagram_chat_1", "title": "Instagram Chat 1 (Mock)"},
@@ -72,7 +77,7 @@ class InstagramService:
         ]
         
         for chat in mock_chats:
-            await self.db.create_chat(account_id, chat["id"], chat["title"])
+            await self.db.create_chat(account_id, chat["id"], chat["title"], user_id=user_id)
             
             # Add mock messages
             await self.db.store_message(
@@ -82,6 +87,7 @@ class InstagramService:
                 sender_id="mock_sender",
                 sender_name="Mock User",
                 text=f"This is a mock message from {chat['title']}. Replace with real Instagram Graph API calls when DM access is available.",
+                user_id=user_id
             )
             
     async def send_message(self, user_id: str, account_id: str, chat_id: str, text: str) -> str:
@@ -95,6 +101,7 @@ class InstagramService:
                 sender_id="self",
                 sender_name="You",
                 text=f"[MOCK SENT] {text}",
+                user_id=user_id
             )
             
             logger.info(f"Mock Instagram message sent: {text}")
@@ -103,3 +110,11 @@ class InstagramService:
         except Exception as e:
             logger.error(f"Error sending Instagram message: {e}")
             raise e
+
+    async def send_many(self, user_id: str, targets: List[Dict], text: str, on_result):
+        """Send one text to many (account_id, chat_id) targets through the rate-aware dispatcher"""
+        await self.dispatcher.run(
+            targets,
+            lambda target: self.send_message(user_id, target["account_id"], target["chat_id"], text),
+            on_result
+        )
@@ -0,0 +1,200 @@
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from app.services.hash_ring import HashRing
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+# Longest message line a peer accepts; asyncio's default of 64 KiB is too
+# small for bulk messages such as a worker's presence list
+STREAM_LIMIT = 4 * 1024 * 1024
+
+class IPCBus:
+    """Message bus between worker processes on one host, over Unix sockets.
+
+    Every worker listens on `{ipc_dir}/worker-{id}.sock`. Messages are
+    newline-delimited JSON; a message carrying an "id" expects a reply with
+    a matching "reply_to", which is how request() gets results back.
+    Telegram accounts are assigned to workers with a consistent-hash ring,
+    so each client is owned by exactly one process.
+    """
+
+    def __init__(self, worker_id: int, worker_count: int, ipc_dir: str):
+        self.worker_id = worker_id
+        self.worker_count = worker_count
+        self.ipc_dir = ipc_dir
+        self.ring = HashRing(str(i) for i in range(worker_count))
+        self.handlers: Dict[str, Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[int, Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+        self._peer_readers: Dict[int, asyncio.Task] = {}
+        self._connect_locks: Dict[int, asyncio.Lock] = {}
+        self._accepted: Set[asyncio.StreamWriter] = set()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count()
+
+    def _path(self, worker_id: int) -> str:
+        return os.path.join(self.ipc_dir, f"worker-{worker_id}.sock")
+
+    def on(self, message_type: str, handler: Handler):
+        self.handlers[message_type] = handler
+
+    def owner(self, key: str) -> int:
+        return int(self.ring.get(str(key)))
+
+    def is_local(self, key: str) -> bool:
+        return self.owner(key) == self.worker_id
+
+    async def start(self):
+        os.makedirs(self.ipc_dir, exist_ok=True)
+        path = self._path(self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=path, limit=STREAM_LIMIT)
+        logger.info(f"✅ IPC: Worker {self.worker_id}/{self.worker_count} listening on {path}")
+
+    async def stop(self):
+        for task in self._peer_readers.values():
+            task.cancel()
+        for _, writer in self._peers.values():
+            writer.close()
+        self._peers.clear()
+        self._peer_readers.clear()
+        for writer in list(self._accepted):
+            writer.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("IPC bus stopped"))
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+        writer.write(json.dumps(message, default=str).encode() + b"\n")
+        await writer.drain()
+
+    async def _dispatch(self, message: Dict[str, Any]) -> Any:
+        handler = self.handlers.get(message.get("type"))
+        if not handler:
+            raise Exception(f"No IPC handler for {message.get('type')}")
+        return await handler(message)
+
+    async def _respond(self, writer: asyncio.StreamWriter, message: Dict[str, Any]):
+        try:
+            reply = {"reply_to": message["id"], "result": await self._dispatch(message)}
+        except Exception as e:
+            reply = {"reply_to": message["id"], "error": str(e)}
+        await self._write(writer, reply)
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._accepted.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "id" in message:
+                    asyncio.create_task(self._respond(writer, message))
+                else:
+                    asyncio.create_task(self._dispatch_quietly(message))
+        except Exception as e:
+            logger.error(f"❌ IPC: Peer connection error: {e}")
+        finally:
+            self._accepted.discard(writer)
+            writer.close()
+
+    async def _dispatch_quietly(self, message: Dict[str, Any]):
+        try:
+            await self._dispatch(message)
+        except Exception as e:
+            logger.error(f"❌ IPC: Error handling {message.get('type')}: {e}")
+
+    async def _read_replies(self, worker_id: int, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self._pending.pop(reply.get("reply_to"), None)
+                if future and not future.done():
+                    if "error" in reply:
+                        future.set_exception(Exception(reply["error"]))
+                    else:
+                        future.set_result(reply.get("result"))
+        finally:
+            # Leave a newer connection to the same worker in place
+            if self._peers.get(worker_id, (None, None))[0] is reader:
+                self._peers.pop(worker_id, None)
+                self._peer_readers.pop(worker_id, None)
+
+    def _open_peer(self, worker_id: int) -> Optional[asyncio.StreamWriter]:
+        peer = self._peers.get(worker_id)
+        if peer and not peer[1].is_closing():
+            return peer[1]
+        return None
+
+    async def _connect(self, worker_id: int) -> asyncio.StreamWriter:
+        writer = self._open_peer(worker_id)
+        if writer:
+            return writer
+        # Concurrent callers wait for one connection attempt instead of each opening a socket
+        lock = self._connect_locks.setdefault(worker_id, asyncio.Lock())
+        async with lock:
+            writer = self._open_peer(worker_id)
+            if writer:
+                return writer
+            reader, writer = await asyncio.open_unix_connection(self._path(worker_id), limit=STREAM_LIMIT)
+            self._peers[worker_id] = (reader, writer)
+            self._peer_readers[worker_id] = asyncio.create_task(self._read_replies(worker_id, reader))
+            return writer
+
+    async def publish(self, worker_id: int, message: Dict[str, Any]):
+        """Fire-and-forget delivery to one worker"""
+        if worker_id == self.worker_id:
+            await self._dispatch_quietly(message)
+            return
+        await self._write(await self._connect(worker_id), message)
+
+    async def request(self, worker_id: int, message: Dict[str, Any], timeout: float = 30) -> Any:
+        """Deliver a message to one worker and wait for its handler's result"""
+        if worker_id == self.worker_id:
+            return await self._dispatch(message)
+        request_id = f"{self.worker_id}-{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._write(await self._connect(worker_id), {**message, "id": request_id})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """Fire-and-forget delivery to every other worker"""
+        for worker_id in range(self.worker_count):
+            if worker_id == self.worker_id:
+                continue
+            try:
+                await self.publish(worker_id, message)
+            except Exception as e:
+                logger.warning(f"⚠️  IPC: Failed to reach worker {worker_id}: {e}")
+
+def bus_from_env() -> Optional[IPCBus]:
+    """Build the bus for this worker when running under the multi-worker launcher"""
+    worker_count = int(os.getenv("WORKER_COUNT", "1"))
+    if worker_count <= 1:
+        return None
+    return IPCBus(
+        int(os.getenv("WORKER_ID", "0")),
+        worker_count,
+        os.getenv("IPC_DIR", os.path.join(tempfile.gettempdir(), "crossmessenger-ipc"))
+    )
@@ -0,0 +1,25 @@
+from typing import Any, Callable, Optional
+
+class LazyService:
+    """Stands in for a service whose module is expensive to import.
+
+    The factory runs on first attribute access (or an explicit load() during
+    warm-up), so e.g. telethon and aiohttp are only imported once a platform
+    service is actually needed.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instance: Optional[Any] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def load(self) -> Any:
+        if self._instance is None:
+            self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
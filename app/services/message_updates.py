@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+class MessageUpdates:
+    """Edits, deletions and read marks for one account, coalesced until the next flush.
+
+    Repeated edits of a message keep only the latest text, a deletion drops
+    any pending edit of the same message, and read marks keep the highest
+    message id per chat and direction, so a flush is one batched statement
+    per kind of update however many events arrived.
+    """
+
+    def __init__(self):
+        self.edits: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # chat_id None: private chats and basic groups, where Telegram only sends the ids
+        self.deletions: Dict[Optional[str], set] = {}
+        self.reads: Dict[Tuple[str, bool], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.edits) + sum(len(ids) for ids in self.deletions.values()) + len(self.reads)
+
+    def edit(self, chat_id: str, message_id: str, text: str, edited_at: Optional[datetime]):
+        self.edits[(chat_id, message_id)] = {
+            "chat_id": chat_id, "message_id": message_id, "text": text, "edited_at": edited_at
+        }
+
+    def delete(self, chat_id: Optional[str], message_ids: List[str]):
+        for message_id in message_ids:
+            if chat_id is None:
+                for key in [key for key in self.edits if key[1] == message_id]:
+                    del self.edits[key]
+            else:
+                self.edits.pop((chat_id, message_id), None)
+        self.deletions.setdefault(chat_id, set()).update(message_ids)
+
+    def read(self, chat_id: str, max_id: int, outbox: bool):
+        key = (chat_id, outbox)
+        self.reads[key] = max(max_id, self.reads.get(key, 0))
+
+    def restore(self, unapplied: "MessageUpdates"):
+        """Put back updates a failed flush did not write, under anything that arrived since"""
+        for key, edit in unapplied.edits.items():
+            deleted = key[1] in self.deletions.get(key[0], ()) or key[1] in self.deletions.get(None, ())
+            if key not in self.edits and not deleted:
+                self.edits[key] = edit
+        for chat_id, message_ids in unapplied.deletions.items():
+            self.deletions.setdefault(chat_id, set()).update(message_ids)
+        for key, max_id in unapplied.reads.items():
+            self.reads[key] = max(max_id, self.reads.get(key, 0))
+
+    def take(self) -> "MessageUpdates":
+        """Hand the pending updates to a flush and start collecting afresh"""
+        taken = MessageUpdates()
+        taken.edits, self.edits = self.edits, {}
+        taken.deletions, self.deletions = self.deletions, {}
+        taken.reads, self.reads = self.reads, {}
+        return taken
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+from app.encryption import encrypt_data, decrypt_data
+
+logger = logging.getLogger(__name__)
+
+class PendingAuthStore:
+    """Telegram logins between start_auth and verify_auth.
+
+    Each entry holds a live, not yet signed-in TelegramClient. Entries expire
+    after `ttl` seconds and the store holds at most `max_entries`; a sweeper
+    disconnects expired clients so abandoned logins do not leak sockets.
+
+    With `persist` set, the client's StringSession (auth key, not yet
+    authorised) is also written encrypted to the pending_auth table, so
+    verify_auth can rebuild the client on a different worker than start_auth.
+    In that mode the table row is checked on every get(), and a local client
+    whose login was restarted elsewhere is replaced.
+    """
+
+    def __init__(self, db, client_factory: Callable[[str], Any], ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, persist: Optional[bool] = None,
+                 sweep_interval: float = 30):
+        self.db = db
+        self.client_factory = client_factory
+        self.ttl = ttl if ttl is not None else float(os.getenv("AUTH_SESSION_TTL", "300"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("AUTH_SESSION_MAX", "1000"))
+        self.persist = persist if persist is not None else os.getenv("PENDING_AUTH_STORE", "memory") == "database"
+        self.sweep_interval = sweep_interval
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    async def _disconnect(entry: Dict[str, Any]):
+        try:
+            await entry["client"].disconnect()
+        except Exception as e:
+            logger.warning(f"⚠️  AUTH: Failed to disconnect pending client: {e}")
+
+    async def put(self, user_id: str, client: Any, phone: str, phone_code_hash: str):
+        user_id = str(user_id)
+        await self.discard(user_id)
+        await self.sweep()
+        if len(self._entries) >= self.max_entries:
+            await self._disconnect({"client": client})
+            raise Exception("Too many pending Telegram logins, try again later")
+
+        expires_at = time.monotonic() + self.ttl
+        self._entries[user_id] = {
+            "client": client, "phone": phone, "phone_code_hash": phone_code_hash, "expires_at": expires_at
+        }
+        if self.persist:
+            await self.db.save_pending_auth(
+                user_id, phone, phone_code_hash, encrypt_data(client.session.save()),
+                datetime.utcnow() + timedelta(seconds=self.ttl)
+            )
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry and entry["expires_at"] <= time.monotonic():
+            await self.discard(user_id)
+            entry = None
+        if not self.persist:
+            return entry
+
+        # The row is authoritative: start_auth or a code resend may have run on
+        # another worker, leaving this worker's client with a stale phone_code_hash
+        row = await self.db.get_pending_auth(user_id)
+        if entry and row and entry["phone_code_hash"] == row["phone_code_hash"]:
+            return entry
+        if entry:
+            await self._disconnect(self._entries.pop(user_id))
+        if not row:
+            return None
+        client = self.client_factory(decrypt_data(row["session_encrypted"]))
+        await client.connect()
+        remaining = (row["expires_at"] - datetime.utcnow()).total_seconds()
+        entry = {
+            "client": client, "phone": row["phone"], "phone_code_hash": row["phone_code_hash"],
+            "expires_at": time.monotonic() + max(remaining, 0)
+        }
+        self._entries[user_id] = entry
+        return entry
+
+    async def discard(self, user_id: str, disconnect: bool = True):
+        """Forget a pending login; pass disconnect=False once its client has been adopted"""
+        user_id = str(user_id)
+        entry = self._entries.pop(user_id, None)
+        if entry and disconnect:
+            await self._disconnect(entry)
+        if self.persist:
+            await self.db.delete_pending_auth(user_id)
+
+    async def sweep(self):
+        now = time.monotonic()
+        expired = [user_id for user_id, entry in self._entries.items() if entry["expires_at"] <= now]
+        for user_id in expired:
+            await self._disconnect(self._entries.pop(user_id))
+        if expired:
+            logger.info(f"🧹 AUTH: Dropped {len(expired)} expired Telegram logins")
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+                if self.persist:
+                    await self.db.delete_expired_pending_auth()
+            except Exception as e:
+                logger.error(f"❌ AUTH: Pending login sweep failed: {e}")
+
+    def start(self):
+        if not self._sweeper or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for user_id in list(self._entries):
+            await self._disconnect(self._entries.pop(user_id))
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.encryption import (
+    encrypt_data, decrypt_data, needs_reencryption, reencrypt_data, has_rotated_keys
+)
+
+logger = logging.getLogger(__name__)
+
+class SessionVault:
+    """In-memory cache of decrypted account sessions in front of the accounts table.
+
+    Decrypted material is held in bytearrays so it can be zeroed when an entry
+    expires or is evicted, rather than lingering until garbage collection.
+    """
+
+    def __init__(self, db, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.db = db
+        self.ttl = ttl if ttl is not None else float(os.getenv("SESSION_CACHE_TTL", "900"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+        self._cache: "OrderedDict[str, Tuple[bytearray, float]]" = OrderedDict()
+        self._reencrypt_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _wipe(secret: bytearray):
+        for i in range(len(secret)):
+            secret[i] = 0
+
+    def _evict(self, account_id: str):
+        entry = self._cache.pop(account_id, None)
+        if entry:
+            self._wipe(entry[0])
+
+    def _put(self, account_id: str, session: str):
+        self._evict(account_id)
+        self._cache[account_id] = (bytearray(session.encode()), time.monotonic() + self.ttl)
+        while len(self._cache) > self.max_entries:
+            oldest = next(iter(self._cache))
+            self._evict(oldest)
+
+    def purge_expired(self):
+        now = time.monotonic()
+        for account_id in [k for k, (_, expires_at) in self._cache.items() if expires_at <= now]:
+            self._evict(account_id)
+
+    def invalidate(self, account_id: str):
+        self._evict(str(account_id))
+
+    def clear(self):
+        for account_id in list(self._cache):
+            self._evict(account_id)
+
+    async def get_session(self, account_id: str) -> Optional[str]:
+        account_id = str(account_id)
+        entry = self._cache.get(account_id)
+        if entry:
+            secret, expires_at = entry
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(account_id)
+                return secret.decode()
+            self._evict(account_id)
+
+        session_encrypted = await self.db.get_account_session(account_id)
+        if not session_encrypted:
+            return None
+        session = decrypt_data(session_encrypted)
+
+        # Migrate legacy or old-key rows as they are read
+        if needs_reencryption(session_encrypted):
+            try:
+                await self.db.update_account_session(account_id, encrypt_data(session))
+            except Exception as e:
+                logger.warning(f"⚠️  VAULT: Failed to migrate session for account {account_id}: {e}")
+
+        self.purge_expired()
+        self._put(account_id, session)
+        return session
+
+    def remember(self, account_id: str, session: str):
+        """Cache a session that was just written, e.g. right after sign-in"""
+        self._put(str(account_id), session)
+
+    async def store_session(self, account_id: str, session: str):
+        await self.db.update_account_session(account_id, encrypt_data(session))
+        self.remember(account_id, session)
+
+    async def reencrypt_all(self, batch_size: int = 100, pause: float = 0.1) -> int:
+        """Re-encrypt every stored session under the primary key, in batches"""
+        last_id = 0
+        migrated = 0
+        while True:
+            rows = await self.db.get_account_sessions_batch(last_id, batch_size)
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                try:
+                    if needs_reencryption(row['session_encrypted']):
+                        updates.append((row['id'], reencrypt_data(row['session_encrypted'])))
+                except Exception as e:
+                    logger.error(f"❌ VAULT: Cannot re-encrypt session for account {row['id']}: {e}")
+            await self.db.update_account_sessions(updates)
+            migrated += len(updates)
+            last_id = rows[-1]['id']
+            if len(rows) < batch_size:
+                break
+            await asyncio.sleep(pause)
+        logger.info(f"✅ VAULT: Re-encrypted {migrated} sessions")
+        return migrated
+
+    def start_reencryption(self, batch_size: int = 100, pause: float = 0.1, force: bool = False):
+        """Run reencrypt_all in the background when rotated keys are configured"""
+        if not (force or has_rotated_keys()):
+            return
+        if self._reencrypt_task and not self._reencrypt_task.done():
+            return
+        self._reencrypt_task = asyncio.create_task(self.reencrypt_all(batch_size, pause))
+
+    async def stop(self):
+        if self._reencrypt_task and not self._reencrypt_task.done():
+            self._reencrypt_task.cancel()
+            try:
+                await self._reencrypt_task
+            except asyncio.CancelledError:
+                pass
+        self.clear()
@@ -1,31 +1,145 @@
 
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, types
 from telethon.sessions import StringSession
-from telethon.errors import PhoneCodeInvalidError, PhoneNumberInvalidError
+from telethon.errors import PhoneCodeInvalidError, PhoneNumberInvalidError, FloodWaitError
 import asyncio
 import os
 import logging
-from typing import Dict, Optional
-from datetime import datetime
-from app.encryption import encrypt_data, decrypt_data
+from typing import Any, Dict, List, Optional, Union
+from datetime import datetime, timezone
+from app.encryption import encrypt_data
 from app.services.websocket_manager import websocket_manager
+from app.services.session_vault import SessionVault
+from app.services.entity_cache import EntityCache
+from app.services.message_updates import MessageUpdates
+from app.services.traffic_capture import TrafficRecorder
+from app.services.dispatcher import SendDispatcher
+from app.services.pending_auth import PendingAuthStore
 
 logger = logging.getLogger(__name__)
 
+def _flood_wait_seconds(error: Exception) -> Optional[float]:
+    return float(error.seconds) if isinstance(error, FloodWaitError) else None
+
+def _utc(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """A datetime or ISO timestamp as the naive UTC the TIMESTAMP columns hold"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value) if isinstance(value, str) else value
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+# Failed flushes of one account's updates retried before its oldest batch is dropped
+MAX_UPDATE_FLUSH_RETRIES = 5
+
 class TelegramService:
     def __init__(self, db):
         self.db = db
         self.api_id = int(os.getenv("API_ID", "0"))
         self.api_hash = os.getenv("API_HASH", "")
         self.clients: Dict[str, TelegramClient] = {}
-        self.auth_sessions: Dict[str, Dict] = {}
+        self.pending_auth = PendingAuthStore(
+            db, lambda session: TelegramClient(StringSession(session), self.api_id, self.api_hash)
+        )
+        self.session_vault = SessionVault(db)
+        self.bus = None
+        self.cluster = None
+        self._handlers: Dict[str, List[Any]] = {}
+        self._inflight: Dict[str, int] = {}
+        self.entity_caches: Dict[str, EntityCache] = {}
+        self.entity_cache_size = int(os.getenv("ENTITY_CACHE_SIZE", "5000"))
+        self._account_users: Dict[str, str] = {}
+        self._entity_flushes: Dict[str, asyncio.Task] = {}
+        self.message_updates: Dict[str, MessageUpdates] = {}
+        self._update_flushes: Dict[str, asyncio.Task] = {}
+        self._update_flush_failures: Dict[str, int] = {}
+        self.update_flush_retry_delay = 5.0
+        # Inbound events whose storage failed; they are logged, not raised, so the replay reads this
+        self.event_errors = 0
+        # TELEGRAM_CAPTURE_FILE records every inbound event for offline replay
+        self.recorder = TrafficRecorder.from_env()
+        self.dispatcher = SendDispatcher(
+            concurrency=int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "8")),
+            per_account_rate=float(os.getenv("TELEGRAM_SEND_RATE", "20")),
+            retry_after=_flood_wait_seconds
+        )
+
+    def attach_cluster(self, cluster):
+        """Let a ClusterCoordinator decide which accounts this node connects"""
+        self.cluster = cluster
+
+    def attach_bus(self, bus):
+        """Route work for accounts owned by other worker processes over the IPC bus"""
+        self.bus = bus
+        bus.on("telegram.send", self._handle_remote_send)
+        bus.on("telegram.attach", self._handle_remote_attach)
+
+    def _owner(self, account_id: str) -> Optional[int]:
+        if self.bus and not self.bus.is_local(account_id):
+            return self.bus.owner(account_id)
+        return None
+
+    async def _handle_remote_send(self, message: Dict) -> str:
+        return await self.send_message(
+            message["user_id"], message["account_id"], message["chat_id"], message["text"]
+        )
+
+    async def _handle_remote_attach(self, message: Dict):
+        await self.attach_account(message["account_id"])
+
+    async def _connect_client(self, account_id: str) -> TelegramClient:
+        session_string = await self.session_vault.get_session(account_id)
+        if not session_string:
+            raise Exception("Account session not found")
+        client = TelegramClient(StringSession(session_string), self.api_id, self.api_hash)
+        await client.connect()
+        self.clients[account_id] = client
+        return client
+
+    async def attach_account(self, account_id: str):
+        """Take ownership of a stored account: connect, listen and backfill recent chats"""
+        if account_id in self.clients:
+            return
+        client = await self._connect_client(account_id)
+        await self._start_message_listener(account_id, client)
+        asyncio.create_task(self._load_recent_chats(account_id, client))
+
+    async def detach_account(self, account_id: str, timeout: float = 10):
+        """Stop taking new events for an account, let in-flight handlers finish, then disconnect"""
+        client = self.clients.pop(account_id, None)
+        if not client:
+            return
+        for handler in self._handlers.pop(account_id, []):
+            client.remove_event_handler(handler)
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self._inflight.get(account_id) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        self._inflight.pop(account_id, None)
+        await self._flush_entities(account_id)
+        await self._flush_message_updates(account_id)
+        self.message_updates.pop(account_id, None)
+        self._update_flush_failures.pop(account_id, None)
+        self.entity_caches.pop(account_id, None)
+        self._account_users.pop(account_id, None)
+        await client.disconnect()
         
     async def start(self):
+        self.session_vault.start_reencryption(force=bool(os.getenv("SESSION_REENCRYPT_ON_START")))
+        self.pending_auth.start()
         logger.info("Telegram service started")
         
     async def stop(self):
+        for account_id in list(self.entity_caches):
+            await self._flush_entities(account_id)
+        for account_id in list(self.message_updates):
+            await self._flush_message_updates(account_id)
         for client in self.clients.values():
             await client.disconnect()
+        await self.session_vault.stop()
+        await self.pending_auth.stop()
+        if self.recorder:
+            self.recorder.close()
         logger.info("Telegram service stopped")
         
     async def start_auth(self, user_id: str, phone: str) -> str:
@@ -33,12 +147,12 @@ class TelegramService:
             client = TelegramClient(StringSession(), self.api_id, self.api_hash)
             await client.connect()
             
-            result = await client.send_code_request(phone)
-            self.auth_sessions[user_id] = {
-                "client": client,
-                "phone": phone,
-                "phone_code_hash": result.phone_code_hash
-            }
+            try:
+                result = await client.send_code_request(phone)
+            except Exception:
+                await client.disconnect()
+                raise
+            await self.pending_auth.put(user_id, client, phone, result.phone_code_hash)
             
             return result.phone_code_hash
         except Exception as e:
@@ -47,7 +161,7 @@ class TelegramService:
             
     async def verify_auth(self, user_id: str, phone: str, code: str) -> str:
         try:
-            session_data = self.auth_sessions.get(user_id)
+            session_data = await self.pending_auth.get(user_id)
             if not session_data:
                 raise Exception("No active auth session")
                 
@@ -67,16 +181,26 @@ class TelegramService:
             account_id = await self.db.create_account(
                 user_id, "telegram", platform_account_id, encrypted_session
             )
-            
-            # Start listening for messages
-            await self._start_message_listener(account_id, client)
-            self.clients[account_id] = client
-            
-            # Load recent chats
-            await self._load_recent_chats(account_id, client)
-            
-            # Clean up auth session
-            del self.auth_sessions[user_id]
+            self.session_vault.remember(account_id, session_string)
+
+            # The client is adopted below, so drop the pending entry without disconnecting it
+            await self.pending_auth.discard(user_id, disconnect=False)
+
+            owner = self._owner(account_id)
+            if self.cluster and not await self.cluster.claim(account_id):
+                # Another node owns this account and connects it on its next tick
+                await client.disconnect()
+            elif owner is not None:
+                # Another worker owns this account; hand the session over to it
+                await client.disconnect()
+                await self.bus.request(owner, {"type": "telegram.attach", "account_id": account_id})
+            else:
+                # Start listening for messages
+                await self._start_message_listener(account_id, client)
+                self.clients[account_id] = client
+
+                # Load recent chats
+                await self._load_recent_chats(account_id, client)
             
             return account_id
             
@@ -86,82 +210,314 @@ class TelegramService:
             logger.error(f"Error verifying Telegram auth: {e}")
             raise e
             
+    async def _get_entity_cache(self, account_id: str) -> EntityCache:
+        cache = self.entity_caches.get(account_id)
+        if cache is None:
+            cache = EntityCache(self.entity_cache_size)
+            try:
+                cache.load(await self.db.get_contacts(account_id, self.entity_cache_size))
+            except Exception as e:
+                logger.warning(f"Could not warm entity cache for account {account_id}: {e}")
+            self.entity_caches[account_id] = cache
+        return cache
+
+    async def _flush_entities(self, account_id: str):
+        cache = self.entity_caches.get(account_id)
+        if cache and cache.dirty:
+            try:
+                await self.db.upsert_contacts(account_id, cache.take_dirty())
+            except Exception as e:
+                logger.error(f"Error persisting contacts for account {account_id}: {e}")
+
+    def _schedule_entity_flush(self, account_id: str, delay: float = 1.0):
+        """Batch contact writes from the message handler instead of writing per message"""
+        task = self._entity_flushes.get(account_id)
+        if task and not task.done():
+            return
+
+        async def flush_later():
+            await asyncio.sleep(delay)
+            await self._flush_entities(account_id)
+
+        self._entity_flushes[account_id] = asyncio.create_task(flush_later())
+
+    def _schedule_update_flush(self, account_id: str, delay: float = 0.5):
+        """Apply edits, deletions and read marks in batches rather than per event"""
+        task = self._update_flushes.get(account_id)
+        # A failing flush reschedules itself from inside its own task
+        if task and not task.done() and task is not asyncio.current_task():
+            return
+
+        async def flush_later():
+            await asyncio.sleep(delay)
+            await self._flush_message_updates(account_id)
+
+        self._update_flushes[account_id] = asyncio.create_task(flush_later())
+
+    async def _flush_message_updates(self, account_id: str):
+        pending = self.message_updates.get(account_id)
+        if not pending:
+            return
+        updates = pending.take()
+        deltas: List[Dict[str, Any]] = []
+        user_id = None
+        try:
+            # The owner's chat list reads are pinned to the primary along with the chats
+            user_id = await self._get_account_user(account_id)
+            # Each kind is cleared from `updates` once written, so a failure
+            # puts back only what was not applied
+            if updates.edits:
+                edits = list(updates.edits.values())
+                await self.db.update_message_texts("telegram", edits, user_id=user_id)
+                updates.edits = {}
+                deltas.extend({
+                    "type": "message:edited", "platform": "telegram", "chat_id": edit["chat_id"],
+                    "message_id": edit["message_id"], "text": edit["text"]
+                } for edit in edits)
+
+            for chat_id, message_ids in list(updates.deletions.items()):
+                rows = await self.db.delete_messages("telegram", account_id, chat_id, sorted(message_ids),
+                                                   user_id=user_id)
+                del updates.deletions[chat_id]
+                by_chat: Dict[str, List[str]] = {}
+                if chat_id is not None:
+                    # Tell clients even about messages we never stored
+                    by_chat[chat_id] = sorted(message_ids)
+                else:
+                    for row in rows:
+                        by_chat.setdefault(row["chat_id"], []).append(row["platform_message_id"])
+                deltas.extend({
+                    "type": "message:deleted", "platform": "telegram", "chat_id": deleted_chat, "message_ids": ids
+                } for deleted_chat, ids in by_chat.items())
+
+            if updates.reads:
+                reads = [(chat_id, max_id, outbox) for (chat_id, outbox), max_id in updates.reads.items()]
+                await self.db.mark_messages_read("telegram", account_id, reads, user_id=user_id)
+                updates.reads = {}
+                deltas.extend({
+                    "type": "chat:read", "platform": "telegram", "chat_id": chat_id,
+                    "max_id": max_id, "outbox": outbox
+                } for chat_id, max_id, outbox in reads)
+            self._update_flush_failures.pop(account_id, None)
+        except Exception as e:
+            self.event_errors += 1
+            failures = self._update_flush_failures.get(account_id, 0) + 1
+            if failures > MAX_UPDATE_FLUSH_RETRIES:
+                # Give up on this batch so it cannot hold back the account's later updates
+                logger.error(f"Dropping {len(updates)} message updates for account {account_id} "
+                             f"after {MAX_UPDATE_FLUSH_RETRIES} retries: {e}")
+                self._update_flush_failures.pop(account_id, None)
+                if pending:
+                    self._schedule_update_flush(account_id)
+            else:
+                logger.error(f"Error applying message updates for account {account_id}, will retry: {e}")
+                self._update_flush_failures[account_id] = failures
+                pending.restore(updates)
+                self._schedule_update_flush(account_id, delay=self.update_flush_retry_delay)
+
+        if user_id and deltas:
+            for delta in deltas:
+                await websocket_manager.send_to_user(user_id, delta)
+
+    async def _resolve_sender(self, cache: EntityCache, message) -> Dict[str, Any]:
+        # Entities bundled with the update are local; only fall back to a network
+        # round trip for senders we have never seen
+        if message.sender is not None:
+            return cache.put(message.sender)
+        entry = cache.get(message.sender_id) if message.sender_id else None
+        if entry:
+            return entry
+        sender = await message.get_sender()
+        if sender is None:
+            return {"id": str(message.sender_id), "name": "Unknown", "type": "unknown", "avatar": None}
+        return cache.put(sender)
+
+    async def _get_account_user(self, account_id: str) -> Optional[str]:
+        user_id = self._account_users.get(account_id)
+        if user_id is None:
+            user_id = await self.db.get_account_user_id(account_id)
+            if user_id is not None:
+                self._account_users[account_id] = user_id
+        return user_id
+
+    async def _handle_event(self, account_id: str, record: Dict[str, Any]):
+        """Apply one normalized inbound event.
+
+        Live Telegram updates and replayed captures both come through here, so
+        a replay exercises the same storage and fan-out path as production.
+        """
+        if self.recorder:
+            self.recorder.record(account_id, record)
+        kind = record["kind"]
+        if kind == "message:new":
+            await self._ingest_message(account_id, record)
+            return
+
+        updates = self.message_updates.setdefault(account_id, MessageUpdates())
+        if kind == "message:edited":
+            edited_at = _utc(record.get("edited_at"))
+            updates.edit(record["chat_id"], record["message_id"], record["text"], edited_at)
+        elif kind == "message:deleted":
+            updates.delete(record["chat_id"], record["message_ids"])
+        elif kind == "chat:read":
+            updates.read(record["chat_id"], record["max_id"], record["outbox"])
+        else:
+            logger.warning(f"Unknown Telegram event kind {kind}")
+            return
+        self._schedule_update_flush(account_id)
+
+    async def _ingest_message(self, account_id: str, record: Dict[str, Any]):
+        try:
+            user_id = await self._get_account_user(account_id)
+            # Store message in DB
+            await self.db.store_message(
+                chat_id=record["chat_id"],
+                platform="telegram",
+                platform_message_id=record["message_id"],
+                sender_id=record["sender_id"],
+                sender_name=record["sender_name"],
+                text=record["text"],
+                timestamp=_utc(record["date"]),
+                user_id=user_id
+            )
+
+            # Send to WebSocket
+            message_data = {
+                "type": "message:new",
+                "platform": "telegram",
+                "chat_id": record["chat_id"],
+                "message_id": record["message_id"],
+                "sender_name": record["sender_name"],
+                "text": record["text"],
+                "timestamp": record["date"]
+            }
+
+            if user_id:
+                await websocket_manager.send_to_user(user_id, message_data)
+        except Exception as e:
+            self.event_errors += 1
+            logger.error(f"Error handling new message: {e}")
+
     async def _start_message_listener(self, account_id: str, client: TelegramClient):
+        cache = await self._get_entity_cache(account_id)
+
         @client.on(events.NewMessage)
         async def handle_new_message(event):
+            self._inflight[account_id] = self._inflight.get(account_id, 0) + 1
             try:
-                chat_id = str(event.chat_id)
-                sender = await event.get_sender()
-                sender_name = getattr(sender, 'first_name', '') or getattr(sender, 'title', 'Unknown')
-                
-                # Store message in DB
-                await self.db.store_message(
-                    chat_id=chat_id,
-                    platform="telegram",
-                    platform_message_id=str(event.id),
-                    sender_id=str(sender.id),
-                    sender_name=sender_name,
-                    text=event.text or "",
-                    timestamp=event.date
-                )
-                
-                # Send to WebSocket
-                message_data = {
-                    "type": "message:new",
-                    "platform": "telegram",
-                    "chat_id": chat_id,
-                    "sender_name": sender_name,
+                sender = await self._resolve_sender(cache, event)
+                await self._handle_event(account_id, {
+                    "kind": "message:new",
+                    "chat_id": str(event.chat_id),
+                    "message_id": str(event.id),
+                    "sender_id": sender["id"],
+                    "sender_name": sender["name"],
                     "text": event.text or "",
-                    "timestamp": event.date.isoformat()
-                }
-                
-                # Get user_id from account
-                accounts = await self.db.get_user_accounts("")  # We need to modify this
-                for account in accounts:
-                    if account['id'] == account_id:
-                        await websocket_manager.send_to_user(account['user_id'], message_data)
-                        break
+                    "date": event.date.isoformat()
+                })
+
+                if cache.dirty:
+                    self._schedule_entity_flush(account_id)
                         
             except Exception as e:
                 logger.error(f"Error handling new message: {e}")
+            finally:
+                self._inflight[account_id] = self._inflight.get(account_id, 1) - 1
+
+        @client.on(events.Raw(types.UpdateUserName))
+        async def handle_user_name(update):
+            cache.rename(update.user_id, update.first_name)
+            if cache.dirty:
+                self._schedule_entity_flush(account_id)
+
+        @client.on(events.MessageEdited)
+        async def handle_message_edited(event):
+            edit_date = event.message.edit_date
+            await self._handle_event(account_id, {
+                "kind": "message:edited",
+                "chat_id": str(event.chat_id),
+                "message_id": str(event.id),
+                "text": event.text or "",
+                "edited_at": edit_date.isoformat() if edit_date else None
+            })
+
+        @client.on(events.MessageDeleted)
+        async def handle_message_deleted(event):
+            await self._handle_event(account_id, {
+                "kind": "message:deleted",
+                # Telegram only names the chat for channel and supergroup deletions
+                "chat_id": str(event.chat_id) if event.chat_id is not None else None,
+                "message_ids": [str(message_id) for message_id in event.deleted_ids]
+            })
+
+        async def handle_message_read(event):
+            # Content reads (voice notes, videos played) are not read receipts
+            if event.contents or event.max_id is None:
+                return
+            await self._handle_event(account_id, {
+                "kind": "chat:read", "chat_id": str(event.chat_id), "max_id": event.max_id, "outbox": event.outbox
+            })
+
+        # MessageRead matches one direction per registration
+        client.add_event_handler(handle_message_read, events.MessageRead(inbox=True))
+        client.add_event_handler(handle_message_read, events.MessageRead(inbox=False))
+
+        self._handlers[account_id] = [
+            handle_new_message, handle_user_name, handle_message_edited, handle_message_deleted, handle_message_read
+        ]
                 
     async def _load_recent_chats(self, account_id: str, client: TelegramClient):
+        cache = await self._get_entity_cache(account_id)
         try:
+            user_id = await self._get_account_user(account_id)
             async for dialog in client.iter_dialogs(limit=20):
+                if dialog.entity is not None:
+                    cache.put(dialog.entity)
                 await self.db.create_chat(
                     account_id=account_id,
                     chat_id=str(dialog.id),
-                    title=dialog.title or "Unknown Chat"
+                    title=dialog.title or "Unknown Chat",
+                    user_id=user_id
                 )
                 
                 # Load recent messages
                 async for message in client.iter_messages(dialog, limit=50):
                     if message.text:
-                        sender = await message.get_sender()
-                        sender_name = getattr(sender, 'first_name', '') or getattr(sender, 'title', 'Unknown')
+                        sender = await self._resolve_sender(cache, message)
                         
                         await self.db.store_message(
                             chat_id=str(dialog.id),
                             platform="telegram",
                             platform_message_id=str(message.id),
-                            sender_id=str(sender.id),
-                            sender_name=sender_name,
+                            sender_id=sender["id"],
+                            sender_name=sender["name"],
                             text=message.text,
-                            timestamp=message.date
+                            timestamp=_utc(message.date),
+                            user_id=user_id
                         )
         except Exception as e:
             logger.error(f"Error loading recent chats: {e}")
+        await self._flush_entities(account_id)
             
     async def send_message(self, user_id: str, account_id: str, chat_id: str, text: str) -> str:
         try:
+            # Re-checked per send: a stalled node may have lost the lease since its last tick
+            if self.cluster and not await self.cluster.confirm(account_id):
+                return await self.cluster.forward_send({
+                    "user_id": user_id, "account_id": account_id, "chat_id": chat_id, "text": text
+                })
+
+            owner = self._owner(account_id)
+            if owner is not None:
+                return await self.bus.request(owner, {
+                    "type": "telegram.send", "user_id": user_id,
+                    "account_id": account_id, "chat_id": chat_id, "text": text
+                })
+
             client = self.clients.get(account_id)
             if not client:
                 # Reconnect client
-                session_encrypted = await self.db.get_account_session(account_id)
-                session_string = decrypt_data(session_encrypted)
-                client = TelegramClient(StringSession(session_string), self.api_id, self.api_hash)
-                await client.connect()
-                self.clients[account_id] = client
+                client = await self._connect_client(account_id)
                 
             message = await client.send_message(int(chat_id), text)
             return str(message.id)
@@ -169,3 +525,11 @@ class TelegramService:
         except Exception as e:
             logger.error(f"Error sending Telegram message: {e}")
             raise e
+
+    async def send_many(self, user_id: str, targets: List[Dict], text: str, on_result):
+        """Send one text to many (account_id, chat_id) targets through the rate-aware dispatcher"""
+        await self.dispatcher.run(
+            targets,
+            lambda target: self.send_message(user_id, target["account_id"], target["chat_id"], text),
+            on_result
+        )
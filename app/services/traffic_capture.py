@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+
+    def at(fraction: float) -> float:
+        if not values:
+            return 0.0
+        return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 3)
+
+    return {"p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": at(1.0)}
+
+class TrafficRecorder:
+    """Appends normalized inbound Telegram events to a JSON lines file.
+
+    Each line is {"at": unix time, "account_id": ..., "event": {...}} where
+    the event is exactly what TelegramService._handle_event received. With
+    `redact` set, message text is replaced by filler of the same length so
+    captures keep their size profile without user content.
+    """
+
+    def __init__(self, path: str, redact: bool = False, flush_every: int = 100):
+        self.path = path
+        self.redact = redact
+        self.flush_every = flush_every
+        self.count = 0
+        self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def from_env(cls) -> Optional["TrafficRecorder"]:
+        path = os.getenv("TELEGRAM_CAPTURE_FILE")
+        if not path:
+            return None
+        logger.info(f"🎙️  CAPTURE: Recording Telegram events to {path}")
+        return cls(path, redact=os.getenv("TELEGRAM_CAPTURE_REDACT", "").lower() in ("1", "true", "yes"))
+
+    def record(self, account_id: str, event: Dict[str, Any]):
+        if self.redact and "text" in event:
+            event = dict(event, text="x" * len(event["text"]))
+        self._file.write(json.dumps({"at": time.time(), "account_id": account_id, "event": event}) + "\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            logger.info(f"🎙️  CAPTURE: Recorded {self.count} events to {self.path}")
+
+def load_capture(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["at"])
+    return records
+
+class TrafficReplayer:
+    """Feeds a capture back through TelegramService._handle_event.
+
+    Events keep their recorded spacing divided by `speed`, and each runs as
+    its own task as Telethon would dispatch it. While replaying, the
+    database pool is sampled to report how often callers had to queue.
+    Batched updates still pending at the end are flushed before reporting.
+
+    The service logs and swallows storage errors, so the report counts them
+    from its `event_errors`. Failed events are left out of the handler
+    latency and the throughput.
+    """
+
+    def __init__(self, service, db, speed: float = 1.0, sample_interval: float = 0.005):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.service = service
+        self.db = db
+        self.speed = speed
+        self.sample_interval = sample_interval
+
+    async def _sample_pool(self, samples: List[tuple]):
+        pool = self.db.pool
+        while True:
+            samples.append((pool.in_use, pool.waiting, pool.limit))
+            await asyncio.sleep(self.sample_interval)
+
+    async def replay(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lags: List[float] = []
+        latencies: List[float] = []
+        samples: List[tuple] = []
+        failures = [0]
+        errors_before = self.service.event_errors
+        sampler = asyncio.create_task(self._sample_pool(samples)) if self.db.pool else None
+
+        async def run(record: Dict[str, Any], due: float):
+            started = time.perf_counter()
+            lags.append(started - due)
+            errors = self.service.event_errors
+            try:
+                await self.service._handle_event(record["account_id"], record["event"])
+            except Exception as e:
+                failures[0] += 1
+                logger.error(f"❌ REPLAY: Handler raised for {record['event'].get('kind')}: {e}")
+                return
+            # Errors logged by the handler itself; concurrent events may share the
+            # attribution, but none of them counts as handled
+            if self.service.event_errors == errors:
+                latencies.append(time.perf_counter() - started)
+
+        tasks = []
+        origin = records[0]["at"] if records else 0.0
+        start = time.perf_counter()
+        try:
+            for record in records:
+                due = start + (record["at"] - origin) / self.speed
+                delay = due - time.perf_counter()
+                # Always yield so due handlers start even when the replay falls behind
+                await asyncio.sleep(max(delay, 0))
+                tasks.append(asyncio.create_task(run(record, due)))
+            await asyncio.gather(*tasks)
+            for account_id in list(self.service.message_updates):
+                await self.service._flush_message_updates(account_id)
+        finally:
+            if sampler:
+                sampler.cancel()
+        duration = time.perf_counter() - start
+
+        span = (records[-1]["at"] - origin) / self.speed if records else 0.0
+        errors = failures[0] + self.service.event_errors - errors_before
+        if errors:
+            logger.warning(f"⚠️  REPLAY: {errors} handler errors; throughput and latency cover only handled events")
+        report: Dict[str, Any] = {
+            "events": len(records),
+            "handled": len(latencies),
+            "handler_errors": errors,
+            "speed": self.speed,
+            "duration_s": round(duration, 3),
+            "target_events_per_s": round(len(records) / span, 1) if span else None,
+            "events_per_s": round(len(latencies) / duration, 1) if duration else None,
+            "schedule_lag": _percentiles(lags),
+            "handler_latency": _percentiles(latencies),
+        }
+        if self.db.pool:
+            report["pool"] = {
+                **self.db.pool.stats(),
+                "peak_in_use": max((s[0] for s in samples), default=0),
+                "peak_waiting": max((s[1] for s in samples), default=0),
+                # Share of samples with every admitted connection busy
+                "saturated_pct": round(100 * sum(1 for s in samples if s[0] >= s[2]) / len(samples), 1) if samples else 0.0,
+            }
+        return report
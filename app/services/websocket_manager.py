@@ -1,32 +1,258 @@
-
 from fastapi import WebSocket
-from typing import Dict, Any
-import json
+from typing import Dict, Any, Iterable, List, Optional, Set
+import asyncio
+import os
+import time
 import logging
+from app.auth import token_cache
+from app.services.wire_format import JSON, JSONFormat
 
 logger = logging.getLogger(__name__)
 
+# Close codes: policy violation for bad tokens, try-again-later for capacity
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# User ids per presence message, so a worker's full list never makes one huge IPC line
+PRESENCE_CHUNK = 1000
+
+class Connection:
+    __slots__ = ("websocket", "user_id", "token_hash", "last_seen", "wire", "outbox", "flusher")
+
+    def __init__(self, websocket: WebSocket, user_id: str, token_hash: Optional[str],
+                 wire: JSONFormat = JSON):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.token_hash = token_hash
+        self.last_seen = time.monotonic()
+        self.wire = wire
+        # Encoded events waiting to go out in one frame, for batched formats
+        self.outbox: list = []
+        self.flusher: Optional[asyncio.Task] = None
+
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
+    def __init__(self, ping_interval: Optional[float] = None, idle_timeout: Optional[float] = None,
+                 max_per_user: Optional[int] = None, max_connections: Optional[int] = None,
+                 batch_window: Optional[float] = None, batch_max: Optional[int] = None):
+        self.ping_interval = ping_interval or float(os.getenv("WS_PING_INTERVAL", "25"))
+        self.idle_timeout = idle_timeout or float(os.getenv("WS_IDLE_TIMEOUT", "75"))
+        self.max_per_user = max_per_user or int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "10"))
+        self.max_connections = max_connections or int(os.getenv("WS_MAX_CONNECTIONS", "100000"))
+        self.batch_window = batch_window if batch_window is not None else float(os.getenv("WS_BATCH_WINDOW_MS", "10")) / 1000
+        self.batch_max = batch_max or int(os.getenv("WS_BATCH_MAX", "64"))
+        self.active_connections: Dict[str, List[Connection]] = {}
+        self.connection_count = 0
+        self._reaper_task: Optional[asyncio.Task] = None
+        self.bus = None
+        # Other workers holding sockets for each user, kept current by their presence messages
+        self.remote_users: Dict[str, Set[int]] = {}
+        self._announcements: Set[asyncio.Task] = set()
+
+    def attach_bus(self, bus):
+        """Fan events out to sockets held by other worker processes.
+
+        Each worker tells the others when a user's first socket connects to it
+        and when the last one goes, so events are only published to workers
+        that hold the user's sockets. A worker joining (or restarting) says
+        hello; the others drop what they knew about it and send it their users.
+        Events in the moment before a new socket's presence arrives are not
+        forwarded; clients load history after connecting.
+        """
+        self.bus = bus
+        bus.on("ws.send", self._handle_remote_send)
+        bus.on("ws.presence", self._handle_presence)
+        bus.on("ws.hello", self._handle_hello)
+        self._announce({"type": "ws.hello", "worker_id": bus.worker_id})
+
+    async def _handle_remote_send(self, message: Dict[str, Any]):
+        await self.send_local(message["user_id"], message["message"])
+
+    async def _handle_presence(self, message: Dict[str, Any]):
+        worker_id = message["worker_id"]
+        for user_id in message["user_ids"]:
+            if message["online"]:
+                self.remote_users.setdefault(user_id, set()).add(worker_id)
+            elif user_id in self.remote_users:
+                workers = self.remote_users[user_id]
+                workers.discard(worker_id)
+                if not workers:
+                    del self.remote_users[user_id]
+
+    async def _handle_hello(self, message: Dict[str, Any]):
+        worker_id = message["worker_id"]
+        await self._handle_presence({"worker_id": worker_id, "user_ids": list(self.remote_users), "online": False})
+        user_ids = list(self.active_connections)
+        for i in range(0, len(user_ids), PRESENCE_CHUNK):
+            await self.bus.publish(worker_id, {
+                "type": "ws.presence", "worker_id": self.bus.worker_id,
+                "user_ids": user_ids[i:i + PRESENCE_CHUNK], "online": True
+            })
+
+    def _announce(self, message: Dict[str, Any]):
+        if not self.bus:
+            return
+        task = asyncio.create_task(self.bus.broadcast(message))
+        self._announcements.add(task)
+        task.add_done_callback(self._announcements.discard)
+
+    def _announce_presence(self, user_ids: Iterable[str], online: bool):
+        if self.bus:
+            self._announce({"type": "ws.presence", "worker_id": self.bus.worker_id,
+                            "user_ids": list(user_ids), "online": online})
+
+    async def connect(self, websocket: WebSocket, user_id: str, token_hash: Optional[str] = None,
+                      wire: JSONFormat = JSON) -> Optional[Connection]:
+        connections = self.active_connections.get(user_id, [])
+        if self.connection_count >= self.max_connections or len(connections) >= self.max_per_user:
+            logger.warning(f"WebSocket rejected for user {user_id}: connection limit reached")
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return None
+
+        if wire.subprotocol:
+            await websocket.accept(subprotocol=wire.subprotocol)
+        else:
+            await websocket.accept()
+        connection = Connection(websocket, user_id, token_hash, wire)
+        if not connections:
+            self._announce_presence([user_id], True)
+        self.active_connections.setdefault(user_id, []).append(connection)
+        self.connection_count += 1
         logger.info(f"WebSocket connected for user {user_id}")
-        
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
+        return connection
+
+    def disconnect(self, user_id: str, connection: Optional[Connection] = None):
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return
+        if connection is None:
+            for dropped in connections:
+                self._cancel_flush(dropped)
+            self.connection_count -= len(connections)
             del self.active_connections[user_id]
-            logger.info(f"WebSocket disconnected for user {user_id}")
-            
+            self._announce_presence([user_id], False)
+        elif connection in connections:
+            self._cancel_flush(connection)
+            connections.remove(connection)
+            self.connection_count -= 1
+            if not connections:
+                del self.active_connections[user_id]
+                self._announce_presence([user_id], False)
+        else:
+            return
+        logger.info(f"WebSocket disconnected for user {user_id}")
+
+    def touch(self, connection: Connection):
+        connection.last_seen = time.monotonic()
+
+    async def _close(self, connection: Connection, code: int = 1000):
+        self.disconnect(connection.user_id, connection)
+        try:
+            await connection.websocket.close(code=code)
+        except Exception:
+            pass
+
     async def send_to_user(self, user_id: str, message: Dict[str, Any]):
-        if user_id in self.active_connections:
+        if self.bus:
+            for worker_id in list(self.remote_users.get(user_id, ())):
+                try:
+                    await self.bus.publish(worker_id, {"type": "ws.send", "user_id": user_id, "message": message})
+                except Exception as e:
+                    logger.warning(f"Failed to forward event for user {user_id} to worker {worker_id}: {e}")
+        await self.send_local(user_id, message)
+
+    async def send_local(self, user_id: str, message: Dict[str, Any]):
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return
+        # Encode once per wire format in use, however many sockets the user has
+        encoded: Dict[str, Any] = {}
+        for connection in list(connections):
+            wire = connection.wire
+            data = encoded.get(wire.name)
+            if data is None:
+                data = encoded[wire.name] = wire.encode(message)
+            if wire.batched:
+                await self._enqueue(connection, data)
+            else:
+                await self._send_frame(connection, data)
+
+    async def _send_frame(self, connection: Connection, frame):
+        try:
+            if isinstance(frame, bytes):
+                await connection.websocket.send_bytes(frame)
+            else:
+                await connection.websocket.send_text(frame)
+        except Exception as e:
+            logger.error(f"Error sending message to user {connection.user_id}: {e}")
+            self.disconnect(connection.user_id, connection)
+
+    async def _enqueue(self, connection: Connection, data):
+        connection.outbox.append(data)
+        if len(connection.outbox) >= self.batch_max:
+            await self._flush(connection)
+        elif not connection.flusher:
+            connection.flusher = asyncio.create_task(self._flush_later(connection))
+
+    async def _flush_later(self, connection: Connection):
+        await asyncio.sleep(self.batch_window)
+        connection.flusher = None
+        await self._flush(connection)
+
+    async def _flush(self, connection: Connection):
+        batch, connection.outbox = connection.outbox, []
+        if batch:
+            await self._send_frame(connection, connection.wire.frame(batch))
+
+    @staticmethod
+    def _cancel_flush(connection: Connection):
+        if connection.flusher:
+            connection.flusher.cancel()
+            connection.flusher = None
+        connection.outbox = []
+
+    async def _ping(self, connection: Connection):
+        frame = connection.wire.single({"type": "ping"})
+        send = connection.websocket.send_bytes if isinstance(frame, bytes) else connection.websocket.send_text
+        try:
+            await asyncio.wait_for(send(frame), timeout=self.ping_interval)
+        except Exception:
+            await self._close(connection)
+
+    async def reap(self):
+        """Close idle or revoked connections and ping the rest"""
+        now = time.monotonic()
+        to_ping = []
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                if connection.token_hash and token_cache.is_revoked(connection.token_hash):
+                    await self._close(connection, CLOSE_POLICY_VIOLATION)
+                elif now - connection.last_seen > self.idle_timeout:
+                    await self._close(connection)
+                else:
+                    to_ping.append(connection)
+        # Ping in chunks so one slow socket cannot hold up the whole sweep
+        for i in range(0, len(to_ping), 1000):
+            await asyncio.gather(*(self._ping(c) for c in to_ping[i:i + 1000]))
+
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
             try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
+                await self.reap()
             except Exception as e:
-                logger.error(f"Error sending message to user {user_id}: {e}")
-                self.disconnect(user_id)
+                logger.error(f"Error reaping WebSocket connections: {e}")
+
+    def start(self):
+        if not self._reaper_task or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reaper_loop())
+
+    async def stop(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                await self._close(connection, 1001)
 
 # Global instance
 websocket_manager = WebSocketManager()
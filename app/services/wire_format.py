@@ -0,0 +1,104 @@
+"""WebSocket wire formats, negotiated per connection through the subprotocol.
+
+Plain JSON is the default. Formats with `batched` set also provide
+frame(), which joins several encoded events into one frame; the others send
+each encoded event as its own frame.
+
+MessagePack needs the optional `msgpack` package. It is only offered when
+that package imports, so clients asking for it without it installed get
+another format they offered, or plain JSON.
+"""
+import json
+from typing import Any, Dict, List, Optional, Union
+
+# Short names for the fields that repeat on every message event. Compact
+# formats rename these top-level keys and leave everything else untouched.
+KEYS = {
+    "type": "t",
+    "platform": "p",
+    "account_id": "a",
+    "chat_id": "c",
+    "message_id": "m",
+    "sender_id": "s",
+    "sender_name": "n",
+    "text": "x",
+    "timestamp": "ts",
+    "attachments": "at",
+    "status": "st",
+}
+
+def compact_keys(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {KEYS.get(key, key): value for key, value in event.items()}
+
+Frame = Union[str, bytes]
+
+class JSONFormat:
+    """The original format: one JSON text frame per event"""
+    subprotocol: Optional[str] = None
+    name = "json"
+    batched = False
+
+    def encode(self, event: Dict[str, Any]) -> Frame:
+        return json.dumps(event)
+
+    def single(self, event: Dict[str, Any]) -> Frame:
+        return self.encode(event)
+
+class CompactJSONFormat(JSONFormat):
+    """Short keys, no whitespace, and every text frame a JSON array of events"""
+    subprotocol = "crossmessenger.compact-json"
+    name = "compact-json"
+    batched = True
+
+    def encode(self, event: Dict[str, Any]) -> Frame:
+        return json.dumps(compact_keys(event), separators=(",", ":"))
+
+    def frame(self, encoded: List[Frame]) -> Frame:
+        return "[" + ",".join(encoded) + "]"
+
+    def single(self, event: Dict[str, Any]) -> Frame:
+        return self.frame([self.encode(event)])
+
+class MsgPackFormat(CompactJSONFormat):
+    """Short keys in MessagePack; every binary frame is an array of events"""
+    subprotocol = "crossmessenger.msgpack"
+    name = "msgpack"
+
+    def __init__(self):
+        import msgpack
+        self._packb = msgpack.packb
+
+    def encode(self, event: Dict[str, Any]) -> Frame:
+        return self._packb(compact_keys(event), default=str)
+
+    def frame(self, encoded: List[Frame]) -> Frame:
+        # A MessagePack array is its length header followed by the packed
+        # items, so already encoded events are joined without re-packing
+        count = len(encoded)
+        if count < 16:
+            header = bytes([0x90 | count])
+        elif count < 0x10000:
+            header = b"\xdc" + count.to_bytes(2, "big")
+        else:
+            header = b"\xdd" + count.to_bytes(4, "big")
+        return header + b"".join(encoded)
+
+JSON = JSONFormat()
+
+def _available_formats() -> Dict[str, JSONFormat]:
+    formats = {CompactJSONFormat.subprotocol: CompactJSONFormat()}
+    try:
+        formats[MsgPackFormat.subprotocol] = MsgPackFormat()
+    except ImportError:
+        # msgpack is optional; clients offering it fall back to another format
+        pass
+    return formats
+
+FORMATS = _available_formats()
+
+def negotiate(offered: List[str]) -> JSONFormat:
+    """The first WebSocket subprotocol the client offered that we support, else plain JSON"""
+    for subprotocol in offered:
+        if subprotocol in FORMATS:
+            return FORMATS[subprotocol]
+    return JSON
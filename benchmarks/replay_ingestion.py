@@ -0,0 +1,143 @@
+"""Offline replay of captured Telegram traffic through the ingestion path.
+
+Record a capture by running the API with TELEGRAM_CAPTURE_FILE=capture.jsonl
+(add TELEGRAM_CAPTURE_REDACT=1 to drop message text), or synthesize one with
+--synthesize. The replay feeds every event through
+TelegramService._handle_event and Database.store_message without a Telegram
+connection, and reports throughput, handler latency percentiles and how
+saturated the database pool was. Events whose handling failed are counted in
+handler_errors, left out of the throughput, and make the script exit non-zero.
+
+By default the database is simulated in-process: a pool of --pool-size
+connections where every query takes --db-latency-ms. Pass --database-url to
+replay against a real PostgreSQL instead (its schema must be migrated).
+
+Usage:
+  python benchmarks/replay_ingestion.py capture.jsonl --speed 10
+  python benchmarks/replay_ingestion.py capture.jsonl --synthesize 5000 --rate 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.database import Database
+from app.db_pool import ManagedPool
+from app.services.telegram_service import TelegramService
+from app.services.traffic_capture import TrafficReplayer, load_capture
+
+class SimulatedConnection:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.next_id = 0
+
+    async def _query(self):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    async def fetchval(self, query, *args):
+        await self._query()
+        self.next_id += 1
+        return self.next_id
+
+    async def fetch(self, query, *args):
+        await self._query()
+        return []
+
+    async def execute(self, query, *args):
+        await self._query()
+
+    async def executemany(self, query, args):
+        await self._query()
+
+class SimulatedPool:
+    """Stands in for asyncpg.Pool: `size` connections, each query sleeping `latency`"""
+
+    def __init__(self, size: int, latency: float):
+        self._free = asyncio.Queue()
+        for _ in range(size):
+            self._free.put_nowait(SimulatedConnection(latency))
+
+    async def acquire(self):
+        return await self._free.get()
+
+    async def release(self, conn):
+        self._free.put_nowait(conn)
+
+    async def close(self):
+        pass
+
+def synthesize(path: str, count: int, rate: float, accounts: int, chats: int):
+    """Poisson arrivals of mostly new messages with some edits, deletions and read receipts"""
+    now = time.time()
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(count):
+            now += random.expovariate(rate)
+            chat_id = str(random.randrange(chats))
+            roll = random.random()
+            if roll < 0.85 or n < 10:
+                event = {
+                    "kind": "message:new", "chat_id": chat_id, "message_id": str(n),
+                    "sender_id": str(random.randrange(1000)), "sender_name": "Sender",
+                    "text": "x" * random.randint(5, 200),
+                    "date": datetime.fromtimestamp(now, timezone.utc).isoformat()
+                }
+            elif roll < 0.92:
+                event = {"kind": "message:edited", "chat_id": chat_id, "message_id": str(random.randrange(n)),
+                         "text": "edited", "edited_at": datetime.fromtimestamp(now, timezone.utc).isoformat()}
+            elif roll < 0.95:
+                event = {"kind": "message:deleted", "chat_id": None, "message_ids": [str(random.randrange(n))]}
+            else:
+                event = {"kind": "chat:read", "chat_id": chat_id, "max_id": n, "outbox": random.random() < 0.5}
+            f.write(json.dumps({"at": now, "account_id": str(random.randrange(accounts) + 1), "event": event}) + "\n")
+
+async def run(args) -> dict:
+    db = Database()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        await db.init_pool()
+        if not db.pool:
+            raise SystemExit("Could not connect to --database-url")
+    else:
+        db.pool = ManagedPool(SimulatedPool(args.pool_size, args.db_latency_ms / 1000), "simulated",
+                              min_size=1, max_size=args.pool_size)
+
+    service = TelegramService(db)
+    records = load_capture(args.capture)
+    # The replay has no users behind its accounts; skip the lookup and the WebSocket fan-out
+    for account_id in {record["account_id"] for record in records}:
+        service._account_users[account_id] = f"replay-{account_id}"
+
+    # The replayer flushes batched edits, deletions and read marks before reporting
+    report = await TrafficReplayer(service, db, speed=args.speed).replay(records)
+    await db.close()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="JSON lines capture written by TELEGRAM_CAPTURE_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier, e.g. 1 to 100")
+    parser.add_argument("--database-url", help="Replay against this PostgreSQL instead of the simulated pool")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--synthesize", type=int, metavar="N", help="First write N synthetic events to the capture file")
+    parser.add_argument("--rate", type=float, default=100.0, help="Events per second when synthesizing")
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--chats", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.capture, args.synthesize, args.rate, args.accounts, args.chats)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if report["handler_errors"]:
+        raise SystemExit(f"{report['handler_errors']} events failed; see the log above")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Cold-start benchmark for the API process.
+
+Measures, over several fresh interpreters:
+  * import: time to `import main`, and which heavy modules it pulled in
+  * live / ready: time from spawning uvicorn until /api/health/live and
+    /api/health/ready answer 200, with FAST_STARTUP off and on
+
+Usage: python benchmarks/startup_benchmark.py [--runs 5] [--port 5055]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("telethon", "aiohttp", "asyncpg", "cryptography", "jwt")
+
+IMPORT_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+import main
+elapsed = time.perf_counter() - t
+print(elapsed, ",".join(m for m in %r if m in sys.modules))
+""" % (HEAVY_MODULES,)
+
+def measure_import(runs: int):
+    times, heavy = [], ""
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1].split(" ")
+        times.append(float(out[0]))
+        heavy = out[1] if len(out) > 1 else ""
+    return times, heavy
+
+def wait_for(url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return time.perf_counter()
+        except Exception:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+def measure_server(runs: int, port: int, fast: bool):
+    env = dict(os.environ, FAST_STARTUP="1" if fast else "")
+    live, ready = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            base = f"http://127.0.0.1:{port}/api/health"
+            live.append(wait_for(f"{base}/live", start + 60) - start)
+            ready.append(wait_for(f"{base}/ready", start + 60) - start)
+        finally:
+            proc.terminate()
+            proc.wait()
+    return live, ready
+
+def report(label: str, samples):
+    print(f"{label:<28} median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    times, heavy = measure_import(args.runs)
+    report("import main", times)
+    print(f"{'heavy modules imported':<28} {heavy or 'none'}")
+    for fast in (False, True):
+        live, ready = measure_server(args.runs, args.port, fast)
+        mode = "fast" if fast else "eager"
+        report(f"{mode} startup: live", live)
+        report(f"{mode} startup: ready", ready)
+
+if __name__ == "__main__":
+    main()
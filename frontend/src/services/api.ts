@@ -45,6 +45,14 @@ export class ApiService {
     return response.data
   }
 
+  static async getInbox(limit = 50, cursor?: string, platforms?: string[]) {
+    const params = new URLSearchParams({ limit: String(limit) })
+    if (cursor) params.set('cursor', cursor)
+    if (platforms?.length) params.set('platform', platforms.join(','))
+    const response = await apiClient.get(`/inbox?${params}`)
+    return response.data
+  }
+
   static async sendMessage(platform: string, accountId: string, chatId: string, text: string) {
     const response = await apiClient.post('/messages/send', {
       platform,
@@ -1,6 +1,31 @@
+// Mirrors KEYS in app/services/wire_format.py
+const COMPACT_KEYS: Record<string, string> = {
+  t: 'type',
+  p: 'platform',
+  a: 'account_id',
+  c: 'chat_id',
+  m: 'message_id',
+  s: 'sender_id',
+  n: 'sender_name',
+  x: 'text',
+  ts: 'timestamp',
+  at: 'attachments',
+  st: 'status',
+}
+const COMPACT_PROTOCOL = 'crossmessenger.compact-json'
+
+function expandKeys(event: Record<string, any>) {
+  const expanded: Record<string, any> = {}
+  for (const [key, value] of Object.entries(event)) {
+    expanded[COMPACT_KEYS[key] ?? key] = value
+  }
+  return expanded
+}
+
 export class WebSocketService {
   private static ws: WebSocket | null = null
   private static messageHandler: ((message: any) => void) | null = null
+  private static offerCompact = true
 
   static connect(onMessage: (message: any) => void) {
     this.messageHandler = onMessage
@@ -14,26 +39,46 @@ export class WebSocketService {
       const payload = JSON.parse(atob(token.split('.')[1]))
       const userId = payload.user_id
 
-      const wsUrl = `ws://${window.location.host}/ws/${userId}`
-      console.log(`🔌 WEBSOCKET: Connecting to ${wsUrl}`);
-      this.ws = new WebSocket(wsUrl)
+      const wsPath = `/ws/${userId}`
+      const wsUrl = `ws://${window.location.host}${wsPath}?token=${encodeURIComponent(token)}`
+      // Log the path only; the URL carries the access token
+      console.log(`🔌 WEBSOCKET: Connecting to ${wsPath}`);
+      // Offer the compact format. Browsers fail the handshake when the server
+      // does not select an offered subprotocol, so if a connection that offered
+      // it never opens, later attempts connect without it and get plain JSON.
+      const offered = this.offerCompact
+      let opened = false
+      this.ws = offered ? new WebSocket(wsUrl, [COMPACT_PROTOCOL]) : new WebSocket(wsUrl)
 
       this.ws.onopen = () => {
+        opened = true
         console.log('✅ WEBSOCKET: Connected successfully')
       }
 
       this.ws.onmessage = (event) => {
         try {
-          const message = JSON.parse(event.data)
-          console.log('📨 WEBSOCKET MESSAGE:', message);
-          this.messageHandler?.(message)
+          const data = JSON.parse(event.data)
+          // The compact format batches several events into one array frame
+          const messages = this.ws?.protocol === COMPACT_PROTOCOL ? data.map(expandKeys) : [data]
+          for (const message of messages) {
+            // Answer server heartbeats so the connection is not reaped as idle
+            if (message.type === 'ping') {
+              this.send({ type: 'pong' })
+              continue
+            }
+            console.log('📨 WEBSOCKET MESSAGE:', message);
+            this.messageHandler?.(message)
+          }
         } catch (error) {
           console.error('Error parsing WebSocket message:', error)
         }
       }
 
-      this.ws.onclose = () => {
+      this.ws.onclose = (event) => {
         console.log('🔌 WEBSOCKET: Disconnected')
+        // 1008 means the token was rejected; reconnecting would fail the same way
+        if (event.code === 1008) return
+        if (offered && !opened) this.offerCompact = false
         // Attempt to reconnect after 3 seconds
         setTimeout(() => {
           if (this.messageHandler) {
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
@@ -6,20 +7,25 @@ from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 import asyncio
 import json
-import jwt
 import bcrypt
 import logging
+import re
 from datetime import datetime, timedelta
 import os
 from contextlib import asynccontextmanager
 
-# Import our modules
+# Import our modules. Platform services pull in telethon/aiohttp, so they are
+# wrapped in LazyService and only imported on first use or during warm-up.
 from app.database import Database, init_db
 from app.models import User, Account, Chat, Message
-from app.services.telegram_service import TelegramService
-from app.services.instagram_service import InstagramService
-from app.services.websocket_manager import WebSocketManager
-from app.auth import create_access_token, verify_token
+from app.services.lazy import LazyService
+from app.services.websocket_manager import websocket_manager, CLOSE_POLICY_VIOLATION, CLOSE_TRY_AGAIN_LATER
+from app.services.wire_format import negotiate
+from app.services.ipc_bus import bus_from_env
+from app.services.cluster import cluster_from_env
+from app.services.inbox import InboxService
+from app.services.broadcast import BroadcastService
+from app.auth import create_access_token, decode_token, hash_token, revoke_token, sync_revocations, token_cache
 
 # Configure logging
 logging.basicConfig(
@@ -28,39 +34,122 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database instance
-db = Database()
-telegram_service = TelegramService(db)
-instagram_service = InstagramService(db)
-websocket_manager = WebSocketManager()
+class RedactTokenFilter(logging.Filter):
+    """Masks the ?token= query parameter the WebSocket handshake carries.
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup
-    logger.info("🚀 BACKEND: Starting CrossMessenger...")
+    Uvicorn logs request paths with their query string, both in the access
+    log and in its "WebSocket /ws/..." lines, which would otherwise record
+    every client's JWT.
+    """
+    pattern = re.compile(r"(token=)[^&\s\"]+")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.args, tuple):
+            record.args = tuple(
+                self.pattern.sub(r"\1[redacted]", arg) if isinstance(arg, str) else arg
+                for arg in record.args
+            )
+        return True
+
+for _uvicorn_logger in ("uvicorn.access", "uvicorn.error"):
+    logging.getLogger(_uvicorn_logger).addFilter(RedactTokenFilter())
+
+# FAST_STARTUP=1 serves liveness immediately and connects the database and
+# platform services in a background warm-up; /api/health/ready reports when done
+FAST_STARTUP = os.getenv("FAST_STARTUP", "").lower() in ("1", "true", "yes")
+
+def _make_telegram_service():
+    from app.services.telegram_service import TelegramService
+    return TelegramService(db)
+
+def _make_instagram_service():
+    from app.services.instagram_service import InstagramService
+    return InstagramService(db)
+
+# Database instance, shared by every service and connected in place at startup
+db = Database()
+telegram_service = LazyService(_make_telegram_service)
+instagram_service = LazyService(_make_instagram_service)
+inbox_service = InboxService(db)
+broadcast_service = BroadcastService(db, telegram_service, instagram_service, websocket_manager)
+background_tasks: List[asyncio.Task] = []
+# Set when running as one of several workers under app.launcher
+ipc_bus = bus_from_env()
+cluster = None
+ready = False
+
+async def startup():
+    global cluster, ready
     try:
-        global db
-        db = await init_db()
+        await init_db(db)
         logger.info("✅ BACKEND: Database initialized")
 
+        if db.pool:
+            background_tasks.append(asyncio.create_task(sync_revocations(db)))
+            background_tasks.append(asyncio.create_task(db.autoscale(float(os.getenv("DB_POOL_RESIZE_INTERVAL", "10")))))
+        websocket_manager.start()
+
+        # Import the platform modules off the event loop, then build the services
+        await asyncio.to_thread(_import_platform_modules)
+        telegram_service.load()
+        instagram_service.load()
+
+        if ipc_bus:
+            await ipc_bus.start()
+            telegram_service.attach_bus(ipc_bus)
+            websocket_manager.attach_bus(ipc_bus)
+
         try:
             await telegram_service.start()
             logger.info("✅ BACKEND: Telegram service started")
+
+            # Leases live in PostgreSQL, so cluster mode is unavailable on the SQLite fallback
+            cluster = cluster_from_env(db, telegram_service) if db.pool else None
+            if cluster:
+                telegram_service.attach_cluster(cluster)
+                await cluster.start()
         except Exception as e:
             logger.warning(f"⚠️  BACKEND: Telegram service failed to start: {e}")
 
+        ready = True
         logger.info("🎉 BACKEND: CrossMessenger started successfully on port 5000")
-        yield
     except Exception as e:
         logger.error(f"❌ BACKEND: Startup failed: {e}")
+
+def _import_platform_modules():
+    import app.services.telegram_service
+    import app.services.instagram_service
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    logger.info("🚀 BACKEND: Starting CrossMessenger...")
+    startup_task = None
+    if FAST_STARTUP:
+        startup_task = asyncio.create_task(startup())
+    else:
+        await startup()
+    try:
         yield
     finally:
         # Shutdown
         logger.info("🛑 BACKEND: Shutting down...")
+        if startup_task and not startup_task.done():
+            startup_task.cancel()
+        for task in background_tasks:
+            task.cancel()
+        await broadcast_service.stop()
+        await websocket_manager.stop()
+        if ipc_bus:
+            await ipc_bus.stop()
         try:
-            await telegram_service.stop()
+            if cluster:
+                await cluster.stop()
+            if telegram_service.loaded:
+                await telegram_service.stop()
         except:
             pass
+        await db.close()
 
 app = FastAPI(title="CrossMessenger API", lifespan=lifespan)
 
@@ -73,6 +162,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def reject_until_ready(request: Request, call_next):
+    # Under FAST_STARTUP requests arrive while the database and services are
+    # still warming up; answer them with a clean 503 instead of failing inside
+    path = request.url.path
+    if FAST_STARTUP and not ready and path.startswith("/api/") and not path.startswith("/api/health/"):
+        return JSONResponse({"detail": "Starting"}, status_code=503, headers={"Retry-After": "1"})
+    return await call_next(request)
+
 # Mount static files (frontend build)
 import os
 if os.path.exists("frontend/dist"):
@@ -81,6 +179,8 @@ if os.path.exists("frontend/dist"):
 
 security = HTTPBearer()
 
+MAX_BROADCAST_TARGETS = int(os.getenv("MAX_BROADCAST_TARGETS", "1000"))
+
 # Pydantic models
 class TelegramStartRequest(BaseModel):
     phone: str
@@ -96,6 +196,21 @@ class SendMessageRequest(BaseModel):
     text: str
     attachments: Optional[List[Dict[str, Any]]] = []
 
+class BroadcastTarget(BaseModel):
+    platform: str
+    account_id: str
+    chat_id: str
+
+class BroadcastRequest(BaseModel):
+    text: str
+    targets: List[BroadcastTarget]
+
+class ClusterSendRequest(BaseModel):
+    user_id: str
+    account_id: str
+    chat_id: str
+    text: str
+
 class UserRegistration(BaseModel):
     email: str
     password: str
@@ -106,14 +221,33 @@ class UserLogin(BaseModel):
 
 # Auth dependency
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    user_id = verify_token(credentials.credentials)
-    if not user_id:
+    entry = decode_token(credentials.credentials)
+    if not entry:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = await db.get_user_by_id(user_id)
+    if entry["user"]:
+        return entry["user"]
+    user = await db.get_user_by_id(entry["user_id"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    token_cache.set_user(hash_token(credentials.credentials), user)
     return user
 
+# Health endpoints
+@app.get("/api/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+@app.get("/api/health/ready")
+async def readiness():
+    if not ready:
+        raise HTTPException(status_code=503, detail="Starting")
+    return {"status": "ready"}
+
+@app.get("/api/health/db")
+async def database_health():
+    """Pool limits, utilisation and acquire wait times for the primary and each replica"""
+    return db.pool_stats()
+
 # Auth endpoints
 @app.post("/api/auth/register")
 async def register(user_data: UserRegistration):
@@ -155,6 +289,12 @@ async def login(user_data: UserLogin):
     logger.info(f"✅ LOGIN SUCCESS: User ID={user['id']}, Email={user_data.email}")
     return {"access_token": token, "token_type": "bearer"}
 
+@app.post("/api/auth/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security), user: dict = Depends(get_current_user)):
+    await revoke_token(db, credentials.credentials)
+    logger.info(f"👋 LOGOUT: User ID={user['id']}")
+    return {"message": "Logged out"}
+
 # Telegram auth endpoints
 @app.post("/api/auth/telegram/start")
 async def telegram_start(request: TelegramStartRequest, user: dict = Depends(get_current_user)):
@@ -213,10 +353,52 @@ async def send_message(request: SendMessageRequest, user: dict = Depends(get_cur
 
         logger.info(f"✅ MESSAGE SENT: ID={message_id}, Platform={request.platform}")
         return {"message_id": message_id}
+    except PermissionError as e:
+        logger.warning(f"⚠️  SEND REJECTED: User={user['email']}, Chat={request.chat_id}: {e}")
+        raise HTTPException(status_code=403, detail=str(e))
     except Exception as e:
         logger.error(f"❌ SEND MESSAGE ERROR: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/messages/broadcast")
+async def broadcast_message(request: BroadcastRequest, user: dict = Depends(get_current_user)):
+    logger.info(f"📣 BROADCAST: User={user['email']}, Targets={len(request.targets)}")
+
+    if not request.targets or len(request.targets) > MAX_BROADCAST_TARGETS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BROADCAST_TARGETS} targets required")
+    invalid = [t.platform for t in request.targets if t.platform not in ("telegram", "instagram", "internal")]
+    if invalid:
+        raise HTTPException(status_code=400, detail="Invalid platform")
+
+    # Sends run in the background; progress arrives as broadcast:progress WebSocket events
+    broadcast_id = await broadcast_service.start(
+        user['id'], request.text, [dict(t) for t in request.targets]
+    )
+    return {"broadcast_id": broadcast_id, "total": len(request.targets)}
+
+@app.get("/api/messages/broadcast/{broadcast_id}")
+async def get_broadcast(broadcast_id: str, user: dict = Depends(get_current_user)):
+    broadcast = await db.get_broadcast(broadcast_id, user['id'])
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
+@app.post("/api/internal/telegram/send")
+async def cluster_send(request: ClusterSendRequest, x_cluster_secret: str = Header("")):
+    # Sends forwarded by other nodes to the node holding the account's lease
+    if not cluster or not cluster.secret or x_cluster_secret != cluster.secret:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not cluster.owns(request.account_id):
+        raise HTTPException(status_code=409, detail="Account is not owned by this node")
+    try:
+        message_id = await telegram_service.send_message(
+            request.user_id, request.account_id, request.chat_id, request.text
+        )
+        return {"message_id": message_id}
+    except Exception as e:
+        logger.error(f"❌ CLUSTER SEND ERROR: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/chats")
 async def get_chats(user: dict = Depends(get_current_user)):
     chats = await db.get_user_chats(user['id'])
@@ -227,6 +409,16 @@ async def get_messages(chat_id: str, limit: int = 50, user: dict = Depends(get_c
     messages = await db.get_chat_messages(chat_id, limit)
     return {"messages": messages}
 
+@app.get("/api/inbox")
+async def get_inbox(limit: int = 50, cursor: Optional[str] = None, platform: Optional[str] = None,
+                    user: dict = Depends(get_current_user)):
+    # platform is a comma-separated filter, e.g. "telegram,internal"
+    platforms = [p.strip() for p in platform.split(",") if p.strip()] if platform else None
+    try:
+        return await inbox_service.get_inbox(user['id'], min(max(limit, 1), 200), cursor, platforms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/accounts")
 async def get_accounts(user: dict = Depends(get_current_user)):
     accounts = await db.get_user_accounts(user['id'])
@@ -235,19 +427,40 @@ async def get_accounts(user: dict = Depends(get_current_user)):
 @app.delete("/api/accounts/{account_id}")
 async def disconnect_account(account_id: str, user: dict = Depends(get_current_user)):
     await db.disconnect_account(user['id'], account_id)
+    telegram_service.session_vault.invalidate(account_id)
     return {"message": "Account disconnected"}
 
 # WebSocket endpoint
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await websocket_manager.connect(websocket, user_id)
+async def websocket_endpoint(websocket: WebSocket, user_id: str, token: str = ""):
+    if not ready and FAST_STARTUP:
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+        return
+    # Browsers cannot set headers on a WebSocket handshake, so the token comes in the query string
+    entry = decode_token(token) if token else None
+    if not entry or str(entry["user_id"]) != user_id:
+        await websocket.close(code=CLOSE_POLICY_VIOLATION)
+        return
+
+    # Clients opt into a compact or binary format by offering it as a subprotocol
+    wire = negotiate(websocket.scope.get("subprotocols", []))
+    connection = await websocket_manager.connect(websocket, user_id, hash_token(token), wire)
+    if not connection:
+        return
     try:
         while True:
-            # Keep connection alive
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        websocket_manager.disconnect(user_id)
+            # Any frame from the client, text or binary, including heartbeat pongs, counts as activity
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            websocket_manager.touch(connection)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        websocket_manager.disconnect(user_id, connection)
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=5000, reload=True)
\ No newline at end of file
+    # WORKERS=N starts N processes sharing the port; the default is one reloading dev server.
+    # CLUSTER_MODE=1 with distinct NODE_ID/PORT/NODE_ADDRESS runs several nodes on one host.
+    from app.launcher import run
+    run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
\ No newline at end of file
@@ -65,5 +65,40 @@ def test_api_endpoints_exist():
         response = client.post(endpoint, json={}) if endpoint.endswith(('start', 'verify', 'send')) else client.get(endpoint)
         assert response.status_code != 404, f"Endpoint {endpoint} not found"
 
+def test_liveness_and_readiness_are_separate():
+    """Liveness answers at once; readiness waits for startup, which TestClient skips here"""
+    assert client.get("/api/health/live").status_code == 200
+    assert client.get("/api/health/ready").status_code == 503
+
+def test_fast_startup_rejects_api_calls_until_ready(monkeypatch):
+    import main
+    monkeypatch.setattr(main, "FAST_STARTUP", True)
+    monkeypatch.setattr(main, "ready", False)
+    response = client.get("/api/chats", headers={"Authorization": "Bearer fake_token"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/api/health/live").status_code == 200
+
+def test_importing_main_defers_jwt_and_cryptography():
+    import subprocess
+    code = "import sys, main; print(any(m in sys.modules for m in ('jwt', 'cryptography')))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+    assert result.stdout.strip().splitlines()[-1] == "False"
+
+def test_platform_services_are_loaded_lazily():
+    import main
+    assert not main.telegram_service.loaded
+    assert not main.instagram_service.loaded
+
 if __name__ == "__main__":
     pytest.main([__file__])
+
+def test_access_logs_redact_websocket_tokens():
+    import logging
+    from main import RedactTokenFilter
+    record = logging.LogRecord("uvicorn.error", logging.INFO, __file__, 0, '%s - "WebSocket %s" [accepted]',
+                               (("127.0.0.1", 5000), "/ws/1?token=eyJ.abc.def&x=1"), None)
+    RedactTokenFilter().filter(record)
+    assert "eyJ" not in record.getMessage()
+    assert "/ws/1?token=[redacted]&x=1" in record.getMessage()
@@ -0,0 +1,89 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.auth import (
+    create_access_token, verify_token, revoke_token, hash_token, token_cache, TokenCache,
+    JWT_SECRET, JWT_ALGORITHM, REVOCATION_SYNC_OVERLAP, _sync_revocations_once
+)
+
+class FakeDB:
+    def __init__(self):
+        self.revoked = []
+        self.rows = []
+        self.since = []
+
+    async def revoke_token(self, token_hash, user_id, expires_at):
+        self.revoked.append((token_hash, user_id, expires_at))
+
+    async def get_revoked_tokens(self, since=None):
+        self.since.append(since)
+        return [row for row in self.rows if since is None or row["revoked_at"] >= since]
+
+def test_verify_token_caches_decoded_tokens():
+    token_cache.clear()
+    token = create_access_token("42")
+    assert verify_token(token) == "42"
+    with patch("jwt.decode") as decode:
+        assert verify_token(token) == "42"
+        decode.assert_not_called()
+
+def test_verify_token_rejects_garbage():
+    assert verify_token("not-a-token") is None
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(max_entries=2)
+    exp = datetime(2100, 1, 1).timestamp()
+    for i in range(3):
+        cache.put(f"h{i}", str(i), exp)
+    assert cache.get("h0") is None
+    assert cache.get("h2")["user_id"] == "2"
+
+def test_token_cache_respects_exp():
+    cache = TokenCache()
+    cache.put("h", "1", 0)
+    assert cache.get("h") is None
+
+@pytest.mark.asyncio
+async def test_revoked_token_is_rejected_immediately():
+    token_cache.clear()
+    token = create_access_token("7")
+    assert verify_token(token) == "7"
+    db = FakeDB()
+    await revoke_token(db, token)
+    assert verify_token(token) is None
+    assert db.revoked[0][0] == hash_token(token)
+
+def test_token_without_exp_is_rejected():
+    import jwt
+    token_cache.clear()
+    token = jwt.encode({"user_id": "5"}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    assert verify_token(token) is None
+
+def test_cached_user_has_no_password_hash():
+    cache = TokenCache()
+    cache.put("h", "1", datetime(2100, 1, 1).timestamp())
+    cache.set_user("h", {"id": 1, "email": "a@b.c", "password_hash": "secret"})
+    assert cache.get("h")["user"] == {"id": 1, "email": "a@b.c"}
+
+@pytest.mark.asyncio
+async def test_sync_revocations_rereads_the_overlap_window():
+    token_cache.clear()
+    db = FakeDB()
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    expires = datetime(2100, 1, 1)
+    db.rows.append({"token_hash": "a", "revoked_at": now, "expires_at": expires})
+    since = await _sync_revocations_once(db, None)
+    assert since == now
+
+    # Same timestamp as the cursor, and one whose transaction committed late
+    db.rows.append({"token_hash": "b", "revoked_at": now, "expires_at": expires})
+    db.rows.append({"token_hash": "c", "revoked_at": now - timedelta(seconds=1), "expires_at": expires})
+    since = await _sync_revocations_once(db, since)
+    assert db.since[-1] == now - REVOCATION_SYNC_OVERLAP
+    assert since == now
+    assert all(token_cache.is_revoked(h) for h in ("a", "b", "c"))
@@ -0,0 +1,100 @@
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.dispatcher import SendDispatcher
+from app.services.broadcast import BroadcastService
+
+class RetryLater(Exception):
+    seconds = 0.01
+
+@pytest.mark.asyncio
+async def test_dispatcher_caps_concurrency_and_retries_rate_limits():
+    active, peak, attempts, results = 0, 0, {}, []
+
+    async def send(target):
+        nonlocal active, peak
+        attempts[target["chat_id"]] = attempts.get(target["chat_id"], 0) + 1
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.001)
+        active -= 1
+        if target["chat_id"] == "flaky" and attempts["flaky"] == 1:
+            raise RetryLater()
+        if target["chat_id"] == "broken":
+            raise ValueError("boom")
+        return f"m-{target['chat_id']}"
+
+    async def on_result(target, message_id, error):
+        results.append((target["chat_id"], message_id, error))
+
+    dispatcher = SendDispatcher(
+        concurrency=3, per_account_rate=1000,
+        retry_after=lambda e: e.seconds if isinstance(e, RetryLater) else None
+    )
+    targets = [{"account_id": "1", "chat_id": str(i)} for i in range(20)]
+    targets += [{"account_id": "1", "chat_id": "flaky"}, {"account_id": "1", "chat_id": "broken"}]
+    await dispatcher.run(targets, send, on_result)
+
+    assert peak <= 3
+    assert len(results) == 22
+    assert ("flaky", "m-flaky", None) in results
+    assert ("broken", None, "boom") in results
+    assert attempts["broken"] == 1
+
+class FakeDB:
+    def __init__(self):
+        self.updates = []
+
+    async def create_broadcast(self, user_id, text, targets):
+        return "1"
+
+    async def update_broadcast_targets(self, broadcast_id, results):
+        self.updates.extend(results)
+
+    async def get_user_accounts(self, user_id):
+        # asyncpg rejects a str bound to the INTEGER user_id column
+        assert isinstance(user_id, int)
+        return [{"id": 10}]
+
+    async def send_internal_message(self, user_id, chat_id, text):
+        return f"internal-{chat_id}"
+
+class FakePlatform:
+    def __init__(self):
+        self.sent = []
+
+    async def send_many(self, user_id, targets, text, on_result):
+        for target in targets:
+            self.sent.append(target["chat_id"])
+            await on_result(target, f"id-{target['chat_id']}", None)
+
+class FakeWebSockets:
+    def __init__(self):
+        self.events = []
+
+    async def send_to_user(self, user_id, message):
+        self.events.append(message)
+
+@pytest.mark.asyncio
+async def test_broadcast_records_results_and_streams_progress():
+    db, telegram, instagram, ws = FakeDB(), FakePlatform(), FakePlatform(), FakeWebSockets()
+    service = BroadcastService(db, telegram, instagram, ws, flush_size=2)
+    targets = [
+        {"platform": "telegram", "account_id": "10", "chat_id": "a"},
+        {"platform": "telegram", "account_id": "99", "chat_id": "b"},
+        {"platform": "instagram", "account_id": "10", "chat_id": "c"},
+        {"platform": "internal", "account_id": "", "chat_id": "internal_1_2"},
+        {"platform": "internal", "account_id": "", "chat_id": "internal_5_6"},
+    ]
+    await service.start(1, "hello", targets)
+    await asyncio.gather(*service._tasks)
+
+    assert telegram.sent == ["a"] and instagram.sent == ["c"]
+    statuses = {u["index"]: u["status"] for u in db.updates}
+    assert statuses == {0: "sent", 1: "failed", 2: "sent", 3: "sent", 4: "failed"}
+    assert ws.events[-1] == {"type": "broadcast:done", "broadcast_id": "1", "sent": 3, "failed": 2, "total": 5}
+    assert any(e["type"] == "broadcast:progress" for e in ws.events)
@@ -0,0 +1,150 @@
+import pytest
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.cluster import ClusterCoordinator
+
+class FakeClusterDB:
+    """In-memory stand-in for the cluster_nodes and account_leases tables"""
+
+    def __init__(self, account_ids):
+        self.account_ids = account_ids
+        self.nodes = {}
+        self.leases = {}
+
+    async def heartbeat_node(self, node_id, address):
+        self.nodes[node_id] = (address, time.time())
+
+    async def get_live_nodes(self, ttl_seconds):
+        now = time.time()
+        return [{"node_id": n, "address": a} for n, (a, t) in self.nodes.items() if t > now - ttl_seconds]
+
+    async def remove_node(self, node_id):
+        self.nodes.pop(node_id, None)
+        self.leases = {k: v for k, v in self.leases.items() if v[0] != node_id}
+
+    async def acquire_account_lease(self, account_id, node_id, ttl_seconds):
+        lease = self.leases.get(account_id)
+        if lease and lease[0] != node_id and lease[1] > time.time():
+            return False
+        self.leases[account_id] = (node_id, time.time() + ttl_seconds)
+        return True
+
+    async def renew_account_leases(self, node_id, ttl_seconds):
+        renewed = []
+        for account_id, (owner, _) in list(self.leases.items()):
+            if owner == node_id:
+                self.leases[account_id] = (owner, time.time() + ttl_seconds)
+                renewed.append(account_id)
+        return renewed
+
+    async def get_account_owner(self, account_id):
+        lease = self.leases.get(account_id)
+        if lease and lease[1] > time.time():
+            return {"node_id": lease[0], "address": self.nodes[lease[0]][0]}
+        return None
+
+    async def release_account_lease(self, account_id, node_id):
+        if self.leases.get(account_id, (None,))[0] == node_id:
+            del self.leases[account_id]
+
+    async def get_account_ids(self, platform):
+        return self.account_ids
+
+class FakeTelegram:
+    def __init__(self):
+        self.clients = set()
+
+    async def attach_account(self, account_id):
+        self.clients.add(account_id)
+
+    async def detach_account(self, account_id):
+        self.clients.discard(account_id)
+
+def make_node(db, name):
+    return ClusterCoordinator(db, FakeTelegram(), name, f"http://{name}", lease_ttl=30)
+
+async def settle(nodes, rounds=3):
+    for _ in range(rounds):
+        for node in nodes:
+            await node.tick()
+
+@pytest.mark.asyncio
+async def test_accounts_are_owned_by_exactly_one_node():
+    db = FakeClusterDB([str(i) for i in range(60)])
+    nodes = [make_node(db, f"node-{i}") for i in range(3)]
+    await settle(nodes)
+
+    owned = [node.telegram_service.clients for node in nodes]
+    assert all(owned)
+    assert sum(len(o) for o in owned) == 60
+    assert set().union(*owned) == set(db.account_ids)
+
+@pytest.mark.asyncio
+async def test_rebalance_on_join_hands_off_before_takeover():
+    db = FakeClusterDB([str(i) for i in range(60)])
+    first = make_node(db, "node-0")
+    await first.tick()
+    # Takeovers are capped per tick to avoid reconnect storms
+    assert len(first.owned) == first.max_attach_per_tick
+    await first.tick()
+    assert len(first.owned) == 60
+
+    second = make_node(db, "node-1")
+    await second.tick()
+    # The first node still holds every lease, so the newcomer cannot connect yet
+    assert not second.owned
+
+    await settle([first, second])
+    assert first.owned and second.owned
+    assert not first.owned & second.owned
+    assert len(first.owned | second.owned) == 60
+
+@pytest.mark.asyncio
+async def test_takeover_when_node_dies():
+    db = FakeClusterDB([str(i) for i in range(30)])
+    nodes = [make_node(db, f"node-{i}") for i in range(2)]
+    await settle(nodes)
+
+    # node-1 stops heartbeating and its leases lapse
+    db.nodes["node-1"] = (db.nodes["node-1"][0], 0)
+    db.leases = {k: (o, 0 if o == "node-1" else e) for k, (o, e) in db.leases.items()}
+    await nodes[0].tick()
+    assert len(nodes[0].owned) == 30
+
+@pytest.mark.asyncio
+async def test_graceful_stop_releases_leases():
+    db = FakeClusterDB([str(i) for i in range(10)])
+    node = make_node(db, "node-0")
+    await node.tick()
+    await node.stop()
+    assert not db.leases
+    assert not node.telegram_service.clients
+
+@pytest.mark.asyncio
+async def test_stalled_node_detaches_accounts_taken_over():
+    db = FakeClusterDB([str(i) for i in range(30)])
+    nodes = [make_node(db, f"node-{i}") for i in range(2)]
+    await settle(nodes)
+    stalled = nodes[1]
+    lost = set(stalled.owned)
+
+    # node-1 stalls past its lease TTL and node-0 takes its accounts over
+    db.nodes["node-1"] = (db.nodes["node-1"][0], 0)
+    db.leases = {k: (o, 0 if o == "node-1" else e) for k, (o, e) in db.leases.items()}
+    await nodes[0].tick()
+    assert lost <= nodes[0].owned
+
+    # Before its next tick, a send through node-1 re-checks the lease
+    stalled.lease_deadline = 0
+    account_id = next(iter(lost))
+    assert not await stalled.confirm(account_id)
+    assert account_id not in stalled.telegram_service.clients
+
+    db.nodes["node-1"] = (db.nodes["node-1"][0], time.time())
+    await stalled.tick()
+    assert not stalled.owned & nodes[0].owned
+    assert not stalled.telegram_service.clients & nodes[0].telegram_service.clients
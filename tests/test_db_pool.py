@@ -0,0 +1,180 @@
+import asyncio
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Database
+from app.db_pool import ManagedPool
+
+class FakeConn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def fetch(self, query, *args):
+        if self.pool.broken:
+            raise ConnectionError("replica down")
+        self.pool.queries.append(query)
+        self.pool.args.append(args)
+        return [{"id": 1, "source": self.pool.name, "platform": "internal", "attachments_json": "[]"}]
+
+    async def fetchval(self, query, *args):
+        self.pool.queries.append(query)
+        self.pool.args.append(args)
+        return 1
+
+    async def execute(self, query, *args):
+        self.pool.queries.append(query)
+        self.pool.args.append(args)
+
+    async def executemany(self, query, args):
+        self.pool.queries.append(query)
+        self.pool.args.append(args)
+
+class FakePool:
+    def __init__(self, name):
+        self.name = name
+        self.queries = []
+        self.args = []
+        self.broken = False
+        self.closed = False
+
+    async def acquire(self):
+        return FakeConn(self)
+
+    async def release(self, conn):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+def managed(name, **kwargs):
+    kwargs.setdefault("min_size", 1)
+    kwargs.setdefault("max_size", 8)
+    return ManagedPool(FakePool(name), name, **kwargs)
+
+@pytest.mark.asyncio
+async def test_limit_queues_callers_and_records_wait():
+    pool = managed("primary", size=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with pool.acquire():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+    assert pool.in_use == 1 and pool.waiting == 1
+
+    release.set()
+    await asyncio.gather(holder, waiter)
+    stats = pool.stats()
+    assert stats["in_use"] == 0 and stats["acquisitions"] == 2
+    assert stats["wait_ms_max"] >= 10
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_frees_its_place():
+    pool = managed("primary", size=1)
+    async with pool.acquire():
+        waiter = asyncio.create_task(pool.acquire().__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    assert pool.in_use == 0 and pool.waiting == 0
+
+def test_resize_grows_on_waits_and_shrinks_when_idle():
+    pool = managed("primary", size=4, target_wait=0.005)
+    pool._waits.extend([0.05] * 20)
+    assert pool.resize() == 5
+
+    assert pool.resize() == 4
+    pool.limit = 8
+    pool._waits.extend([0.05] * 20)
+    assert pool.resize() == 8
+
+    pool.limit = 1
+    assert pool.resize() == 1
+
+def make_db():
+    db = Database()
+    db.pool = managed("primary")
+    db.replicas = [managed("replica-0")]
+    return db
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_until_user_writes():
+    db = make_db()
+    accounts = await db.get_user_accounts("7")
+    assert accounts[0]["source"] == "replica-0"
+    assert db.replicas[0]._pool.args[-1] == (7,)
+
+    await db.create_account("7", "telegram", "123", "secret")
+    accounts = await db.get_user_accounts("7")
+    assert accounts[0]["source"] == "primary"
+    # Other users keep reading from the replica
+    assert (await db.get_user_chats("8"))[0]["source"] == "replica-0"
+
+    db.read_your_writes_window = 0
+    assert (await db.get_user_accounts("7"))[0]["source"] == "replica-0"
+
+@pytest.mark.asyncio
+async def test_chat_reads_follow_message_writes():
+    db = make_db()
+    await db.store_message("chat1", "internal", "m1", "7", "A", "hi")
+    assert (await db.get_chat_messages("chat1"))[0]["source"] == "primary"
+    assert (await db.get_chat_messages("chat2"))[0]["source"] == "replica-0"
+
+@pytest.mark.asyncio
+async def test_chat_writes_pin_the_owners_chat_list():
+    db = make_db()
+    await db.store_message("chat1", "telegram", "m1", "9", "B", "hi")
+    assert (await db.get_user_chats("7"))[0]["source"] == "replica-0"
+
+    await db.store_message("chat1", "telegram", "m2", "9", "B", "hi", user_id="7")
+    assert (await db.get_user_chats("7"))[0]["source"] == "primary"
+    await db.mark_messages_read("telegram", "3", [("chat2", 5, False)], user_id="8")
+    assert (await db.get_user_chats("8"))[0]["source"] == "primary"
+    assert (await db.get_chat_messages("chat2"))[0]["source"] == "primary"
+
+@pytest.mark.asyncio
+async def test_failed_replica_read_falls_back_to_primary():
+    db = make_db()
+    db.replicas[0]._pool.broken = True
+    assert (await db.get_user_chats("7"))[0]["source"] == "primary"
+    assert db.replicas[0].in_use == 0
+
+@pytest.mark.asyncio
+async def test_pool_stats_and_close():
+    db = make_db()
+    await db.get_user_chats("7")
+    stats = db.pool_stats()
+    assert stats["primary"]["name"] == "primary"
+    assert stats["replicas"][0]["acquisitions"] == 1
+    await db.close()
+    assert db.pool._pool.closed and db.replicas == []
+
+@pytest.mark.asyncio
+async def test_only_participants_can_send_internal_messages():
+    db = make_db()
+    with pytest.raises(PermissionError):
+        await db.send_internal_message(4, "internal_3_5", "hi")
+    with pytest.raises(PermissionError):
+        await db.send_internal_message(4, "not_internal", "hi")
+    assert db.pool._pool.queries == []
+
+@pytest.mark.asyncio
+async def test_internal_chats_are_indexed_by_participant_once():
+    db = make_db()
+    await db.send_internal_message(3, "internal_3_5", "hi")
+    await db.send_internal_message(3, "internal_3_5", "again")
+    inserts = [args for query, args in zip(db.pool._pool.queries, db.pool._pool.args)
+               if "internal_chat_members" in query]
+    assert inserts == [[("internal_3_5", "3"), ("internal_3_5", "5")]]
+
+    await db.get_user_inbox_chats("5", ["internal"])
+    assert "FROM internal_chat_members" in db.pool._pool.queries[-1]
+    assert "split_part" not in db.pool._pool.queries[-1]
@@ -0,0 +1,59 @@
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.entity_cache import EntityCache
+from app.services.telegram_service import TelegramService
+
+class User(SimpleNamespace):
+    pass
+
+def make_user(user_id, first_name):
+    return User(id=user_id, first_name=first_name, photo=None)
+
+def test_entity_cache_lru_and_dirty_tracking():
+    cache = EntityCache(max_entries=2)
+    cache.put(make_user(1, "Ann"))
+    cache.put(make_user(2, "Bob"))
+    cache.get(1)
+    cache.put(make_user(3, "Cid"))
+
+    assert cache.get(2) is None
+    assert cache.get(1)["name"] == "Ann"
+    assert {c["id"] for c in cache.take_dirty()} == {"1", "3"}
+
+    cache.put(make_user(1, "Ann"))
+    assert not cache.dirty
+    cache.rename(1, "Anna")
+    assert cache.take_dirty()[0]["name"] == "Anna"
+
+def test_entity_cache_load_is_not_dirty():
+    cache = EntityCache()
+    cache.load([{"entity_id": "5", "display_name": "Eve", "entity_type": "user", "avatar_ref": None}])
+    assert cache.get(5)["name"] == "Eve"
+    assert not cache.dirty
+
+@pytest.mark.asyncio
+async def test_resolve_sender_avoids_network_for_known_senders():
+    service = TelegramService(db=None)
+    cache = EntityCache()
+    cache.put(make_user(7, "Known"))
+    message = SimpleNamespace(sender=None, sender_id=7, get_sender=AsyncMock())
+
+    sender = await service._resolve_sender(cache, message)
+
+    assert sender["name"] == "Known"
+    message.get_sender.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_resolve_sender_fetches_and_caches_unknown_senders():
+    service = TelegramService(db=None)
+    cache = EntityCache()
+    message = SimpleNamespace(sender=None, sender_id=8, get_sender=AsyncMock(return_value=make_user(8, "New")))
+
+    assert (await service._resolve_sender(cache, message))["name"] == "New"
+    assert cache.get(8)["type"] == "user"
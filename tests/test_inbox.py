@@ -0,0 +1,78 @@
+import pytest
+import sys
+import os
+import random
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.inbox import InboxService, decode_cursor
+
+class FakeInboxDB:
+    def __init__(self, chats, messages):
+        self.chats = chats
+        self.messages = messages
+        self.page_calls = 0
+
+    async def get_user_inbox_chats(self, user_id, platforms=None):
+        return [c for c in self.chats if platforms is None or c["platform"] in platforms]
+
+    async def get_chat_message_pages(self, chat_ids, before, per_chat):
+        self.page_calls += 1
+        pages = {}
+        for chat_id in chat_ids:
+            rows = sorted(
+                (m for m in self.messages if m["chat_id"] == chat_id
+                 and (before is None or (m["timestamp"], m["id"]) < before)),
+                key=lambda m: (m["timestamp"], m["id"]), reverse=True
+            )
+            pages[chat_id] = [dict(r) for r in rows[:per_chat]]
+        return pages
+
+def build_db():
+    random.seed(3)
+    base = datetime(2024, 1, 1)
+    chats = [
+        {"chat_id": "tg1", "platform": "telegram"},
+        {"chat_id": "tg2", "platform": "telegram"},
+        {"chat_id": "ig1", "platform": "instagram"},
+        {"chat_id": "internal_1_2", "platform": "internal"},
+    ]
+    messages = []
+    for i in range(200):
+        chat = random.choice(chats)
+        messages.append({
+            "id": i + 1, "chat_id": chat["chat_id"], "platform": chat["platform"],
+            # Repeated timestamps exercise the id tie-break
+            "timestamp": base + timedelta(minutes=random.randint(0, 120)),
+            "attachments_json": "[]",
+        })
+    return FakeInboxDB(chats, messages)
+
+def expected_order(db, platforms=None):
+    rows = [m for m in db.messages if platforms is None or m["platform"] in platforms]
+    return [m["id"] for m in sorted(rows, key=lambda m: (m["timestamp"], m["id"]), reverse=True)]
+
+@pytest.mark.asyncio
+async def test_inbox_pages_cover_the_merged_timeline():
+    db = build_db()
+    service = InboxService(db, batch_size=7)
+    seen, cursor = [], None
+    while True:
+        page = await service.get_inbox("1", limit=30, cursor=cursor)
+        seen.extend(m["id"] for m in page["messages"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == expected_order(db)
+
+@pytest.mark.asyncio
+async def test_inbox_platform_filter():
+    db = build_db()
+    page = await InboxService(db).get_inbox("1", limit=500, platforms=["telegram"])
+    assert [m["id"] for m in page["messages"]] == expected_order(db, ["telegram"])
+    assert page["next_cursor"] is None
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
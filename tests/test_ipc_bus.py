@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.hash_ring import HashRing
+from app.services.ipc_bus import IPCBus
+
+def test_hash_ring_moves_few_keys_when_node_added():
+    ring = HashRing(["0", "1", "2"])
+    before = {str(k): ring.get(str(k)) for k in range(1000)}
+    assert set(before.values()) == {"0", "1", "2"}
+
+    ring.add("3")
+    moved = [k for k in before if ring.get(k) != before[k]]
+    assert all(ring.get(k) == "3" for k in moved)
+    assert len(moved) < 400
+
+    ring.remove("3")
+    assert all(ring.get(k) == before[k] for k in before)
+
+@pytest.mark.asyncio
+async def test_request_and_broadcast_between_workers(tmp_path):
+    buses = [IPCBus(i, 2, str(tmp_path)) for i in range(2)]
+    received = []
+
+    async def echo(message):
+        return f"worker-1:{message['value']}"
+
+    async def record(message):
+        received.append(message["value"])
+
+    buses[1].on("echo", echo)
+    buses[1].on("event", record)
+    for bus in buses:
+        await bus.start()
+    try:
+        assert await buses[0].request(1, {"type": "echo", "value": "hi"}) == "worker-1:hi"
+        with pytest.raises(Exception, match="No IPC handler"):
+            await buses[0].request(1, {"type": "missing"})
+
+        await buses[0].broadcast({"type": "event", "value": 42})
+        await buses[0].request(1, {"type": "echo", "value": "sync"})
+        assert received == [42]
+        assert {buses[0].owner(str(k)) for k in range(100)} == {0, 1}
+    finally:
+        for bus in buses:
+            await bus.stop()
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_connection(tmp_path):
+    buses = [IPCBus(i, 2, str(tmp_path)) for i in range(2)]
+
+    async def echo(message):
+        return message["value"]
+
+    buses[1].on("echo", echo)
+    for bus in buses:
+        await bus.start()
+    try:
+        results = await asyncio.gather(*(buses[0].request(1, {"type": "echo", "value": n}) for n in range(10)))
+        assert results == list(range(10))
+        assert len(buses[1]._accepted) == 1
+    finally:
+        for bus in buses:
+            await bus.stop()
@@ -0,0 +1,190 @@
+import asyncio
+import pytest
+import sys
+import os
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.message_updates import MessageUpdates
+from app.services.telegram_service import MAX_UPDATE_FLUSH_RETRIES, TelegramService
+
+def test_updates_coalesce_until_taken():
+    updates = MessageUpdates()
+    updates.edit("1", "10", "first", None)
+    updates.edit("1", "10", "second", None)
+    updates.edit("1", "11", "kept", None)
+    updates.edit("2", "12", "dropped", None)
+    updates.delete("2", ["12"])
+    updates.read("1", 10, True)
+    updates.read("1", 8, True)
+    updates.read("1", 5, False)
+
+    taken = updates.take()
+    assert len(updates) == 0
+    assert [e["text"] for e in taken.edits.values()] == ["second", "kept"]
+    assert taken.deletions == {"2": {"12"}}
+    assert taken.reads == {("1", True): 10, ("1", False): 5}
+
+def test_deletion_without_chat_drops_edits_in_any_chat():
+    updates = MessageUpdates()
+    updates.edit("1", "10", "gone", None)
+    updates.delete(None, ["10"])
+    assert not updates.edits
+    assert updates.deletions == {None: {"10"}}
+
+class FakeDB:
+    def __init__(self):
+        self.update_message_texts = AsyncMock()
+        self.mark_messages_read = AsyncMock()
+        self.delete_messages = AsyncMock(side_effect=self._delete)
+        self.get_account_user_id = AsyncMock(return_value="7")
+
+    async def _delete(self, platform, account_id, chat_id, message_ids, user_id=None):
+        return [{"chat_id": chat_id or "55", "platform_message_id": message_id} for message_id in message_ids]
+
+@pytest.mark.asyncio
+async def test_flush_applies_batches_and_pushes_deltas():
+    db = FakeDB()
+    service = TelegramService(db=db)
+    updates = service.message_updates.setdefault("3", MessageUpdates())
+    edited_at = datetime(2024, 1, 1)
+    updates.edit("1", "10", "new text", edited_at)
+    updates.edit("1", "11", "other", edited_at)
+    updates.delete(None, ["20", "21"])
+    updates.read("1", 11, True)
+
+    with patch("app.services.telegram_service.websocket_manager") as manager:
+        manager.send_to_user = AsyncMock()
+        await service._flush_message_updates("3")
+
+    assert db.update_message_texts.await_count == 1
+    assert len(db.update_message_texts.await_args.args[1]) == 2
+    assert db.update_message_texts.await_args.kwargs == {"user_id": "7"}
+    db.delete_messages.assert_awaited_once_with("telegram", "3", None, ["20", "21"], user_id="7")
+    db.mark_messages_read.assert_awaited_once_with("telegram", "3", [("1", 11, True)], user_id="7")
+
+    deltas = [call.args[1] for call in manager.send_to_user.await_args_list]
+    assert all(call.args[0] == "7" for call in manager.send_to_user.await_args_list)
+    assert [d["type"] for d in deltas] == ["message:edited", "message:edited", "message:deleted", "chat:read"]
+    assert deltas[2] == {
+        "type": "message:deleted", "platform": "telegram", "chat_id": "55", "message_ids": ["20", "21"]
+    }
+
+@pytest.mark.asyncio
+async def test_flush_with_nothing_pending_is_a_no_op():
+    db = FakeDB()
+    service = TelegramService(db=db)
+    service.message_updates["3"] = MessageUpdates()
+    await service._flush_message_updates("3")
+    db.update_message_texts.assert_not_called()
+    db.get_account_user_id.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_failed_flush_puts_unapplied_updates_back():
+    db = FakeDB()
+    db.delete_messages.side_effect = ConnectionError("db down")
+    service = TelegramService(db=db)
+    updates = service.message_updates.setdefault("3", MessageUpdates())
+    updates.edit("1", "10", "new text", None)
+    updates.delete("1", ["11"])
+    updates.read("1", 11, True)
+
+    with patch("app.services.telegram_service.websocket_manager") as manager, \
+            patch.object(service, "_schedule_update_flush") as reschedule:
+        manager.send_to_user = AsyncMock()
+        await service._flush_message_updates("3")
+
+    # The edit was written and announced; the deletion and read mark wait for a retry
+    assert [call.args[1]["type"] for call in manager.send_to_user.await_args_list] == ["message:edited"]
+    assert not updates.edits
+    assert updates.deletions == {"1": {"11"}}
+    assert updates.reads == {("1", True): 11}
+    reschedule.assert_called_once()
+
+def test_restore_keeps_newer_updates():
+    updates = MessageUpdates()
+    updates.edit("1", "10", "old", None)
+    updates.read("1", 5, False)
+    taken = updates.take()
+    updates.edit("1", "10", "newer", None)
+    updates.read("1", 9, False)
+
+    updates.restore(taken)
+    assert updates.edits[("1", "10")]["text"] == "newer"
+    assert updates.reads == {("1", False): 9}
+
+@pytest.mark.asyncio
+async def test_chatless_deletion_only_reaches_chats_rows():
+    class Conn:
+        async def fetch(self, query, *args):
+            self.query, self.args = query, args
+            return []
+
+    conn = Conn()
+
+    class Pool:
+        def acquire(self):
+            class Ctx:
+                async def __aenter__(self):
+                    return conn
+
+                async def __aexit__(self, *exc):
+                    pass
+            return Ctx()
+
+    from app.database import Database
+    db = Database()
+    db.pool = Pool()
+    assert await db.delete_messages("telegram", "3", None, ["20"]) == []
+    assert "chat_id IN (SELECT chat_id FROM chats WHERE account_id = $3)" in conn.query
+    assert conn.args == ("telegram", ["20"], 3)
+
+@pytest.mark.asyncio
+async def test_edit_times_reach_the_db_as_naive_utc():
+    db = FakeDB()
+    service = TelegramService(db=db)
+    service._account_users["3"] = "7"
+    await service._handle_event("3", {
+        "kind": "message:edited", "chat_id": "1", "message_id": "10", "text": "new",
+        "edited_at": "2024-01-01T12:00:00+02:00"
+    })
+    service._update_flushes["3"].cancel()
+    with patch("app.services.telegram_service.websocket_manager") as manager:
+        manager.send_to_user = AsyncMock()
+        await service._flush_message_updates("3")
+    edited_at = db.update_message_texts.await_args.args[1][0]["edited_at"]
+    assert edited_at == datetime(2024, 1, 1, 10, 0) and edited_at.tzinfo is None
+
+@pytest.mark.asyncio
+async def test_failed_scheduled_flush_is_retried():
+    db = FakeDB()
+    db.mark_messages_read.side_effect = [ConnectionError("db down"), None]
+    service = TelegramService(db=db)
+    service.update_flush_retry_delay = 0.01
+    service.message_updates.setdefault("3", MessageUpdates()).read("1", 11, True)
+
+    with patch("app.services.telegram_service.websocket_manager") as manager:
+        manager.send_to_user = AsyncMock()
+        service._schedule_update_flush("3", delay=0)
+        await asyncio.sleep(0.1)
+
+    assert db.mark_messages_read.await_count == 2
+    assert not service.message_updates["3"]
+
+@pytest.mark.asyncio
+async def test_updates_are_dropped_after_repeated_failures():
+    db = FakeDB()
+    db.mark_messages_read.side_effect = ConnectionError("bad row")
+    service = TelegramService(db=db)
+    service.update_flush_retry_delay = 0.01
+    service.message_updates.setdefault("3", MessageUpdates()).read("1", 11, True)
+
+    with patch("app.services.telegram_service.websocket_manager") as manager:
+        manager.send_to_user = AsyncMock()
+        service._schedule_update_flush("3", delay=0)
+        await asyncio.sleep(0.2)
+
+    assert db.mark_messages_read.await_count == MAX_UPDATE_FLUSH_RETRIES + 1
+    assert not service.message_updates["3"]
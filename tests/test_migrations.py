@@ -0,0 +1,125 @@
+import pytest
+import sys
+import os
+import aiosqlite
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.migrations import MIGRATIONS, MigrationRunner
+
+class SQLiteDB:
+    def __init__(self, path):
+        self.pool = None
+        self.sqlite_db = path
+
+@pytest.fixture
+def db(tmp_path):
+    return SQLiteDB(str(tmp_path / "test.db"))
+
+@pytest.mark.asyncio
+async def test_startup_skips_background_migrations(db):
+    runner = MigrationRunner(db, throttle=0)
+    applied = await runner.migrate(include_background=False)
+    assert applied == [m.version for m in MIGRATIONS if not m.background]
+    assert [m.version for m in await runner.pending()] == [m.version for m in MIGRATIONS if m.background]
+
+    # Index builds wait for the migrate command like backfills do
+    async with aiosqlite.connect(db.sqlite_db) as conn:
+        cursor = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        indexes = {row[0] for row in await cursor.fetchall()}
+    assert not {"idx_messages_chat_timeline", "idx_messages_platform_message"} & indexes
+
+    await runner.migrate()
+    async with aiosqlite.connect(db.sqlite_db) as conn:
+        cursor = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        indexes = {row[0] for row in await cursor.fetchall()}
+    assert {"idx_messages_chat_timeline", "idx_messages_platform_message"} <= indexes
+
+@pytest.mark.asyncio
+async def test_migrate_is_idempotent(db):
+    runner = MigrationRunner(db, throttle=0)
+    assert await runner.migrate() == [m.version for m in MIGRATIONS]
+    assert await runner.migrate() == []
+
+@pytest.mark.asyncio
+async def test_backfill_runs_in_batches(db):
+    runner = MigrationRunner(db, batch_size=2, throttle=0)
+    await runner.migrate(include_background=False)
+    async with aiosqlite.connect(db.sqlite_db) as conn:
+        for n in range(5):
+            await conn.execute(
+                "INSERT INTO chats (account_id, chat_id, title, last_message_at) VALUES (1, ?, ?, '2020-01-01')",
+                (f"chat{n}", f"Chat {n}")
+            )
+            await conn.execute(
+                "INSERT INTO messages (chat_id, platform, platform_message_id, sender_id, sender_name, text, timestamp) VALUES (?, 'internal', ?, '1', 'A', 'hi', ?)",
+                (f"chat{n}", f"m{n}", f"2024-01-0{n + 1}")
+            )
+        await conn.commit()
+
+    backfill = next(m for m in MIGRATIONS if m.backfill)
+    assert await runner._run_backfill(backfill.backfill) == 3
+
+    async with aiosqlite.connect(db.sqlite_db) as conn:
+        cursor = await conn.execute("SELECT chat_id, last_message_at FROM chats ORDER BY id")
+        rows = await cursor.fetchall()
+    assert rows == [(f"chat{n}", f"2024-01-0{n + 1}") for n in range(5)]
+
+@pytest.mark.asyncio
+async def test_statements_run_before_indexes_and_backfill(db):
+    from app.migrations import Backfill, Index, Migration
+    migration = Migration(
+        1, "priority",
+        sqlite=[
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)",
+            "ALTER TABLE items ADD COLUMN priority INTEGER",
+            "INSERT INTO items (name) VALUES ('a'), ('b'), ('c')",
+        ],
+        indexes=[Index("idx_items_priority", "items (priority)")],
+        backfill=Backfill("items", postgres="",
+                          sqlite="UPDATE items SET priority = id * 10 WHERE id > ? AND id <= ?"),
+    )
+    runner = MigrationRunner(db, migrations=[migration], batch_size=2, throttle=0)
+    assert await runner.migrate() == [1]
+
+    async with aiosqlite.connect(db.sqlite_db) as conn:
+        cursor = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        assert "idx_items_priority" in {row[0] for row in await cursor.fetchall()}
+        cursor = await conn.execute("SELECT priority FROM items ORDER BY id")
+        assert [row[0] for row in await cursor.fetchall()] == [10, 20, 30]
+
+@pytest.mark.asyncio
+async def test_postgres_lock_is_polled_not_waited_on():
+    class Conn:
+        def __init__(self):
+            self.queries = []
+            self.free_after = 2
+
+        async def fetchval(self, query, *args):
+            self.queries.append(query)
+            self.free_after -= 1
+            return self.free_after < 0
+
+        async def execute(self, query, *args):
+            self.queries.append(query)
+
+    conn = Conn()
+
+    class Pool:
+        def acquire(self):
+            class Ctx:
+                async def __aenter__(self):
+                    return conn
+
+                async def __aexit__(self, *exc):
+                    pass
+            return Ctx()
+
+    class PostgresDB:
+        pool = Pool()
+
+    runner = MigrationRunner(PostgresDB(), lock_poll_interval=0)
+    runner._migrate = AsyncMock(return_value=[])
+    assert await runner.migrate() == []
+    assert conn.queries == ["SELECT pg_try_advisory_lock($1)"] * 3 + ["SELECT pg_advisory_unlock($1)"]
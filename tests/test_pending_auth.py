@@ -0,0 +1,101 @@
+import pytest
+import sys
+import os
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.pending_auth import PendingAuthStore
+
+class FakeSession:
+    def __init__(self, value):
+        self.value = value
+
+    def save(self):
+        return self.value
+
+class FakeClient:
+    def __init__(self, session="auth-key"):
+        self.session = FakeSession(session)
+        self.connected = True
+
+    async def connect(self):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+class FakeDB:
+    def __init__(self):
+        self.rows = {}
+
+    async def save_pending_auth(self, user_id, phone, phone_code_hash, session_encrypted, expires_at):
+        self.rows[user_id] = {"phone": phone, "phone_code_hash": phone_code_hash,
+                              "session_encrypted": session_encrypted, "expires_at": expires_at}
+
+    async def get_pending_auth(self, user_id):
+        row = self.rows.get(user_id)
+        return row if row and row["expires_at"] > datetime.utcnow() else None
+
+    async def delete_pending_auth(self, user_id):
+        self.rows.pop(user_id, None)
+
+def make_store(db=None, **kwargs):
+    return PendingAuthStore(db or FakeDB(), lambda session: FakeClient(session), **kwargs)
+
+@pytest.mark.asyncio
+async def test_expired_logins_are_swept_and_disconnected():
+    store = make_store(ttl=0, persist=False)
+    client = FakeClient()
+    await store.put("1", client, "+1", "hash")
+    await store.sweep()
+    assert len(store) == 0
+    assert not client.connected
+
+@pytest.mark.asyncio
+async def test_global_cap_rejects_new_logins():
+    store = make_store(ttl=60, max_entries=1, persist=False)
+    await store.put("1", FakeClient(), "+1", "hash")
+    rejected = FakeClient()
+    with pytest.raises(Exception, match="Too many"):
+        await store.put("2", rejected, "+2", "hash")
+    assert not rejected.connected
+
+@pytest.mark.asyncio
+async def test_restarting_login_replaces_previous_client():
+    store = make_store(ttl=60, persist=False)
+    first = FakeClient()
+    await store.put("1", first, "+1", "hash")
+    await store.put("1", FakeClient(), "+1", "hash2")
+    assert not first.connected
+    assert (await store.get("1"))["phone_code_hash"] == "hash2"
+
+@pytest.mark.asyncio
+async def test_verify_can_resume_on_another_worker():
+    db = FakeDB()
+    start_worker = make_store(db, ttl=60, persist=True)
+    verify_worker = make_store(db, ttl=60, persist=True)
+    await start_worker.put("1", FakeClient("serialized-key"), "+1", "hash")
+
+    entry = await verify_worker.get("1")
+    assert entry["phone_code_hash"] == "hash"
+    assert entry["client"].session.save() == "serialized-key"
+
+    await verify_worker.discard("1", disconnect=False)
+    assert "1" not in db.rows
+    assert entry["client"].connected
+
+@pytest.mark.asyncio
+async def test_local_client_is_replaced_after_resend_on_another_worker():
+    db = FakeDB()
+    worker_a = make_store(db, ttl=60, persist=True)
+    worker_b = make_store(db, ttl=60, persist=True)
+    stale = FakeClient("old-key")
+    await worker_a.put("1", stale, "+1", "old-hash")
+    await worker_b.put("1", FakeClient("new-key"), "+1", "new-hash")
+
+    entry = await worker_a.get("1")
+    assert entry["phone_code_hash"] == "new-hash"
+    assert entry["client"].session.value == "new-key"
+    assert not stale.connected
+    assert await worker_a.get("1") is entry
@@ -0,0 +1,72 @@
+import pytest
+import base64
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.encryption import encrypt_data, decrypt_data, get_fernet, is_legacy_format
+from app.services.session_vault import SessionVault
+
+class FakeDB:
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.reads = 0
+
+    async def get_account_session(self, account_id):
+        self.reads += 1
+        return self.sessions.get(account_id)
+
+    async def update_account_session(self, account_id, session_encrypted):
+        self.sessions[account_id] = session_encrypted
+
+    async def get_account_sessions_batch(self, after_id, limit):
+        ids = sorted(int(k) for k in self.sessions if int(k) > after_id)[:limit]
+        return [{"id": i, "session_encrypted": self.sessions[str(i)]} for i in ids]
+
+    async def update_account_sessions(self, sessions):
+        for account_id, session in sessions:
+            self.sessions[str(account_id)] = session
+
+def legacy_encrypt(data):
+    return base64.b64encode(get_fernet()[1].encrypt(data.encode())).decode()
+
+def test_compact_format_roundtrip():
+    token = encrypt_data("session-string")
+    assert not is_legacy_format(token)
+    assert len(token) < len(legacy_encrypt("session-string"))
+    assert decrypt_data(token) == "session-string"
+    assert decrypt_data(legacy_encrypt("session-string")) == "session-string"
+
+@pytest.mark.asyncio
+async def test_vault_caches_and_migrates_legacy_rows():
+    db = FakeDB({"1": legacy_encrypt("secret")})
+    vault = SessionVault(db, ttl=60, max_entries=10)
+
+    assert await vault.get_session("1") == "secret"
+    assert await vault.get_session("1") == "secret"
+    assert db.reads == 1
+    assert not is_legacy_format(db.sessions["1"])
+
+@pytest.mark.asyncio
+async def test_vault_evicts_lru_and_expired_entries():
+    db = FakeDB({"1": encrypt_data("a"), "2": encrypt_data("b")})
+    vault = SessionVault(db, ttl=60, max_entries=1)
+    await vault.get_session("1")
+    await vault.get_session("2")
+    await vault.get_session("1")
+    assert db.reads == 3
+
+    vault.ttl = 0
+    vault.invalidate("1")
+    await vault.get_session("1")
+    await vault.get_session("1")
+    assert db.reads == 5
+
+@pytest.mark.asyncio
+async def test_reencrypt_all_in_batches():
+    db = FakeDB({str(i): legacy_encrypt(f"s{i}") for i in range(1, 8)})
+    vault = SessionVault(db)
+    assert await vault.reencrypt_all(batch_size=3, pause=0) == 7
+    assert all(not is_legacy_format(v) for v in db.sessions.values())
+    assert await vault.reencrypt_all(batch_size=3, pause=0) == 0
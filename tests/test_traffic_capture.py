@@ -0,0 +1,71 @@
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.telegram_service import TelegramService
+from app.services.traffic_capture import TrafficRecorder, TrafficReplayer, load_capture
+
+def new_message(n):
+    return {
+        "kind": "message:new", "chat_id": "42", "message_id": str(n), "sender_id": "9",
+        "sender_name": "Ann", "text": "secret", "date": "2024-01-01T00:00:00+00:00"
+    }
+
+class FakeDB:
+    def __init__(self):
+        self.pool = None
+        self.store_message = AsyncMock(return_value="1")
+        self.get_account_user_id = AsyncMock(return_value=None)
+
+@pytest.mark.asyncio
+async def test_handled_events_are_recorded_and_redacted(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    service = TelegramService(db=FakeDB())
+    service.recorder = TrafficRecorder(path, redact=True)
+
+    await service._handle_event("3", new_message(1))
+    await service._handle_event("3", {"kind": "chat:read", "chat_id": "42", "max_id": 1, "outbox": True})
+    service.recorder.close()
+
+    records = load_capture(path)
+    assert [r["event"]["kind"] for r in records] == ["message:new", "chat:read"]
+    assert records[0]["account_id"] == "3"
+    assert records[0]["event"]["text"] == "xxxxxx"
+    assert service.message_updates["3"].reads == {("42", True): 1}
+
+@pytest.mark.asyncio
+async def test_replay_feeds_events_through_the_store_path():
+    db = FakeDB()
+    service = TelegramService(db=db)
+    records = [{"at": 1000 + n * 0.1, "account_id": "3", "event": new_message(n)} for n in range(20)]
+
+    report = await TrafficReplayer(service, db, speed=100).replay(records)
+
+    assert db.store_message.await_count == 20
+    assert db.store_message.await_args.kwargs["platform_message_id"] == "19"
+    assert report["events"] == 20
+    assert report["target_events_per_s"] == pytest.approx(1052.6, rel=0.01)
+    assert report["handler_latency"]["p50_ms"] >= 0
+    assert "pool" not in report
+
+def test_replay_rejects_non_positive_speed():
+    with pytest.raises(ValueError):
+        TrafficReplayer(None, None, speed=0)
+
+@pytest.mark.asyncio
+async def test_replay_counts_failed_events_and_stores_naive_utc():
+    db = FakeDB()
+    db.store_message.side_effect = [ConnectionError("db down"), "2", "3"]
+    service = TelegramService(db=db)
+    records = [{"at": 1000 + n * 0.01, "account_id": "3", "event": new_message(n)} for n in range(3)]
+    records[0]["event"]["date"] = "2024-01-01T02:00:00+02:00"
+
+    report = await TrafficReplayer(service, db, speed=100).replay(records)
+
+    assert report["handler_errors"] == 1
+    assert report["handled"] == 2
+    timestamp = db.store_message.await_args_list[0].kwargs["timestamp"]
+    assert timestamp.tzinfo is None and timestamp.hour == 0
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import pytest
+import sys
+import os
+from starlette.websockets import WebSocketDisconnect
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from main import app
+from app.auth import create_access_token, TokenCache
+from app.services.websocket_manager import WebSocketManager, websocket_manager
+from app.services.wire_format import JSON, CompactJSONFormat, MsgPackFormat, negotiate
+
+client = TestClient(app)
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def test_handshake_requires_valid_token():
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/1?token=bad") as ws:
+            ws.receive_text()
+
+def test_handshake_rejects_token_for_other_user():
+    token = create_access_token("2")
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/1?token={token}") as ws:
+            ws.receive_text()
+
+def test_handshake_accepts_matching_token():
+    token = create_access_token("3")
+    with client.websocket_connect(f"/ws/3?token={token}") as ws:
+        ws.send_text('{"type": "pong"}')
+    assert "3" not in websocket_manager.active_connections
+
+@pytest.mark.asyncio
+async def test_per_user_connection_cap():
+    manager = WebSocketManager(max_per_user=2)
+    assert await manager.connect(FakeWebSocket(), "u1")
+    assert await manager.connect(FakeWebSocket(), "u1")
+    rejected = FakeWebSocket()
+    assert await manager.connect(rejected, "u1") is None
+    assert rejected.closed_with == 1013
+    assert manager.connection_count == 2
+
+@pytest.mark.asyncio
+async def test_reap_closes_idle_and_revoked_connections(monkeypatch):
+    # A private cache, so the revocation does not leak into other tests
+    token_cache = TokenCache()
+    monkeypatch.setattr("app.services.websocket_manager.token_cache", token_cache)
+    manager = WebSocketManager(idle_timeout=30)
+    idle_ws, revoked_ws, live_ws = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    idle = await manager.connect(idle_ws, "u1")
+    await manager.connect(revoked_ws, "u2", token_hash="revoked-hash")
+    await manager.connect(live_ws, "u3")
+    idle.last_seen -= 60
+    token_cache.revoke("revoked-hash", 2 ** 40)
+
+    await manager.reap()
+
+    assert idle_ws.closed_with == 1000
+    assert revoked_ws.closed_with == 1008
+    assert live_ws.sent == ['{"type": "ping"}']
+    assert manager.connection_count == 1
+    assert list(manager.active_connections) == ["u3"]
+
+class CountingFormat(CompactJSONFormat):
+    name = "counting"
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, event):
+        self.encoded += 1
+        return super().encode(event)
+
+@pytest.mark.asyncio
+async def test_event_is_encoded_once_per_format():
+    manager = WebSocketManager(batch_window=0)
+    wire = CountingFormat()
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for ws in sockets:
+        await manager.connect(ws, "u1", wire=wire)
+    plain = FakeWebSocket()
+    await manager.connect(plain, "u1")
+
+    await manager.send_local("u1", {"type": "message:new", "chat_id": "42", "text": "hi"})
+    await asyncio.sleep(0.01)
+
+    assert wire.encoded == 1
+    assert all(ws.sent == ['[{"t":"message:new","c":"42","x":"hi"}]'] for ws in sockets)
+    assert plain.sent == ['{"type": "message:new", "chat_id": "42", "text": "hi"}']
+
+@pytest.mark.asyncio
+async def test_compact_format_batches_events_per_frame():
+    manager = WebSocketManager(batch_window=0.01, batch_max=3)
+    ws = FakeWebSocket()
+    await manager.connect(ws, "u1", wire=negotiate(["crossmessenger.compact-json"]))
+
+    for n in range(4):
+        await manager.send_local("u1", {"type": "message:new", "text": str(n)})
+    # The batch cap flushes immediately, the remainder after the window
+    assert len(ws.sent) == 1
+    await asyncio.sleep(0.05)
+    assert [json.loads(frame) for frame in ws.sent] == [
+        [{"t": "message:new", "x": "0"}, {"t": "message:new", "x": "1"}, {"t": "message:new", "x": "2"}],
+        [{"t": "message:new", "x": "3"}],
+    ]
+
+def test_msgpack_frames_are_arrays_of_events():
+    msgpack = pytest.importorskip("msgpack")
+    wire = MsgPackFormat()
+    events = [{"type": "message:new", "text": str(n)} for n in range(20)]
+    frame = wire.frame([wire.encode(event) for event in events])
+    assert msgpack.unpackb(frame) == [{"t": "message:new", "x": str(n)} for n in range(20)]
+
+def test_handshake_negotiates_compact_subprotocol():
+    token = create_access_token("4")
+    with client.websocket_connect(f"/ws/4?token={token}", subprotocols=["unknown", "crossmessenger.compact-json"]) as ws:
+        assert ws.accepted_subprotocol == "crossmessenger.compact-json"
+        ws.send_bytes(b"pong")
+    assert negotiate(["unknown"]) is JSON
+
+@pytest.mark.asyncio
+async def test_events_only_go_to_workers_holding_the_user(tmp_path):
+    from app.services.ipc_bus import IPCBus
+    buses = [IPCBus(i, 3, str(tmp_path)) for i in range(3)]
+    managers = [WebSocketManager(batch_window=0) for _ in buses]
+    published = []
+    for bus, manager in zip(buses, managers):
+        await bus.start()
+        manager.attach_bus(bus)
+    publish = buses[0].publish
+
+    async def spy(worker_id, message):
+        if message["type"] == "ws.send":
+            published.append(worker_id)
+        await publish(worker_id, message)
+
+    buses[0].publish = spy
+    try:
+        ws = FakeWebSocket()
+        await managers[2].connect(ws, "u1")
+        await asyncio.sleep(0.05)
+        assert managers[0].remote_users == {"u1": {2}}
+
+        await managers[0].send_to_user("u1", {"type": "message:new"})
+        await managers[0].send_to_user("u2", {"type": "message:new"})
+        await asyncio.sleep(0.05)
+        assert published == [2]
+        assert ws.sent == ['{"type": "message:new"}']
+
+        managers[2].disconnect("u1")
+        await asyncio.sleep(0.05)
+        assert managers[0].remote_users == {}
+    finally:
+        for bus in buses:
+            await bus.stop()
+        # Let the peer handlers see their sockets close
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_joining_worker_learns_every_remote_user(tmp_path):
+    from app.services.ipc_bus import IPCBus
+    buses = [IPCBus(i, 2, str(tmp_path)) for i in range(2)]
+    managers = [WebSocketManager() for _ in buses]
+    for bus in buses:
+        await bus.start()
+    try:
+        managers[1].attach_bus(buses[1])
+        managers[1].active_connections = {str(n): [object()] for n in range(20000)}
+        managers[0].attach_bus(buses[0])
+        await asyncio.sleep(0.5)
+        assert len(managers[0].remote_users) == 20000
+    finally:
+        for bus in buses:
+            await bus.stop()
+        await asyncio.sleep(0.01)